@@ -0,0 +1,2 @@
+# Benchmarks for the scanner, parsers and CLI. Run modules from the
+# repository root, e.g. python -m benchmarks.harness
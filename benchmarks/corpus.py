@@ -0,0 +1,105 @@
+# Seeded generator for synthetic Lox corpora of a given size and shape.
+#
+#   python -m benchmarks.corpus <shape> [bytes] [seed] > file.lox
+import random
+import sys
+
+WORDS = ["alpha", "beta", "gamma", "delta", "value", "count", "total", "index", "name", "item"]
+KEYWORDS = ["and", "or", "nil", "true", "false", "this", "super"]
+OPERATORS = ["+", "-", "*", "/", "==", "!=", "<", "<=", ">", ">="]
+
+def number(rng) -> str:
+    if rng.random() < 0.3:
+        return f"{rng.randint(0, 999)}.{rng.randint(0, 99)}"
+    return str(rng.randint(0, 9999))
+
+def identifier(rng) -> str:
+    return f"{rng.choice(WORDS)}_{rng.randint(0, 999)}"
+
+# Long binary chains, one expression per line
+def chains(rng, operands: int = 1000) -> str:
+    parts = [number(rng)]
+    for _ in range(operands - 1):
+        parts.append(rng.choice(OPERATORS))
+        parts.append(number(rng))
+    return " ".join(parts)
+
+# Deeply nested groupings and unary operators
+def nesting(rng, depth: int = 200) -> str:
+    expr = number(rng)
+    for _ in range(depth):
+        roll = rng.random()
+        if roll < 0.2:
+            expr = f"-{expr}"
+        elif roll < 0.3:
+            expr = f"!{expr}"
+        else:
+            expr = f"({expr} {rng.choice(OPERATORS)} {number(rng)})"
+    return expr
+
+# String literals, some spanning lines
+def strings(rng, count: int = 8) -> str:
+    parts = []
+    for _ in range(count):
+        words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 8)))
+        if rng.random() < 0.1:
+            words += "\n" + rng.choice(WORDS)
+        parts.append(f'"{words}"')
+    return " + ".join(parts)
+
+# Short expressions between comment lines
+def comments(rng, count: int = 4) -> str:
+    lines = []
+    for _ in range(count):
+        words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 12)))
+        lines.append(f"// {words}")
+    lines.append(f"{number(rng)} {rng.choice(OPERATORS)} {number(rng)} // {rng.choice(WORDS)}")
+    return "\n".join(lines)
+
+# Statements dense in identifiers and keywords
+def identifiers(rng) -> str:
+    roll = rng.random()
+    if roll < 0.3:
+        return f"var {identifier(rng)} = {identifier(rng)} {rng.choice(['and', 'or'])} {rng.choice(KEYWORDS)};"
+    if roll < 0.5:
+        return f"if ({identifier(rng)} == {rng.choice(KEYWORDS)}) print {identifier(rng)}; else {identifier(rng)} = nil;"
+    if roll < 0.7:
+        return f"while ({identifier(rng)} < {number(rng)}) {{ {identifier(rng)} = {identifier(rng)} + 1; }}"
+    if roll < 0.85:
+        return f"fun {identifier(rng)}({identifier(rng)}, {identifier(rng)}) {{ return {identifier(rng)}; }}"
+    return f"class {identifier(rng).title()} < {identifier(rng).title()} {{ }}"
+
+def mixed(rng) -> str:
+    return rng.choice((chains, nesting, strings, comments, identifiers))(rng)
+
+SHAPES = {
+    "chains": chains,
+    "nesting": nesting,
+    "strings": strings,
+    "comments": comments,
+    "identifiers": identifiers,
+    "mixed": mixed,
+}
+
+def generate(shape: str, size: int = 1 << 20, seed: int = 0) -> str:
+    # Lines of the given shape until the corpus is at least size characters
+    rng = random.Random(seed)
+    make = SHAPES[shape]
+    lines = []
+    length = 0
+    while length < size:
+        line = make(rng)
+        lines.append(line)
+        length += len(line) + 1
+    return "\n".join(lines) + "\n"
+
+def main():
+    if not 2 <= len(sys.argv) <= 4 or sys.argv[1] not in SHAPES:
+        print(f"Usage: python -m benchmarks.corpus {'|'.join(SHAPES)} [bytes] [seed]", file=sys.stderr)
+        exit(1)
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 1 << 20
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    sys.stdout.write(generate(sys.argv[1], size, seed))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+# Token rows per second written by the DB logger, one row per INSERT
+# against executemany() batches. Uses the SQLite stand-in, so it needs no
+# MySQL server; round-trip savings against a real server are larger.
+#
+#   python -m benchmarks.db_inserts [tokens]
+import os
+import sys
+import tempfile
+import time
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    directory = tempfile.mkdtemp()
+    os.environ["DB_BACKEND"] = "sqlite"
+    os.environ["DB_PATH"] = os.path.join(directory, "bench.db")
+    os.environ["DB_SCHEMA_MARKER"] = os.path.join(directory, "schema.txt")
+    import model_token_highlighting_db_push as db
+
+    source = "var total = (count + 12) - index;\n" * (count // 10 + 1)
+    tokens = db.Scanner(source).scan_tokens()[:count]
+    db.init_db()
+    conn = db.begin()
+
+    for batch_size in (1, 100, 1000, 10000):
+        log_id = db.log_tokenizer_entry(conn, "bench", len(source), "SUCCESS")
+        start = time.perf_counter()
+        db.log_tokens(conn, log_id, tokens, batch_size)
+        elapsed = time.perf_counter() - start
+        print(f"{f'batches of {batch_size}':>16}: {count / elapsed:10.0f} rows/s")
+    db.close_connection()
+
+if __name__ == "__main__":
+    main()
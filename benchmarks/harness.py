@@ -0,0 +1,150 @@
+# Times scanning, parsing and the whole CLI over generated corpora and
+# compares the results with a stored JSON baseline.
+#
+#   python -m benchmarks.harness --save benchmarks/baseline.json
+#   python -m benchmarks.harness --compare benchmarks/baseline.json
+#
+# Times are the best of --repeat runs. Peak memory comes from a separate
+# run under tracemalloc, which would otherwise slow down the timed runs.
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import main as lox
+from benchmarks.corpus import SHAPES, generate
+
+def scan(source: str, _path: str) -> int:
+    tokens, _ = lox.RegexScanner(source).scan_buffer()
+    return len(tokens)
+
+def parse(source: str, _path: str) -> int:
+    tokens, _ = lox.RegexScanner(source).scan_buffer()
+    # Parse errors are printed as they are found
+    with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+        lox.PARSERS[lox.OPTIONS["parser"]](tokens).parse()
+    return len(tokens)
+
+def run_main(command: str):
+    def phase(source: str, path: str) -> int:
+        sys.argv = ["main.py", command, path, "--no-cache"]
+        with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink), contextlib.redirect_stderr(sink):
+            try:
+                lox.main()
+            except SystemExit:
+                pass
+        return None
+    return phase
+
+PHASES = {
+    "scan": scan,
+    "parse": parse,
+    "main-tokenize": run_main("tokenize"),
+    "main-parse": run_main("parse"),
+}
+
+def measure(phase, source: str, path: str, repeat: int) -> dict:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        tokens = phase(source, path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    try:
+        phase(source, path)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": best, "tokens": tokens, "peak": peak}
+
+def run(shapes, size: int, seed: int, repeat: int) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for shape in shapes:
+            source = generate(shape, size, seed)
+            path = os.path.join(directory, f"{shape}.lox")
+            with open(path, "w") as file:
+                file.write(source)
+            tokens = None
+            for name, phase in PHASES.items():
+                result = measure(phase, source, path, repeat)
+                # The CLI phases do not see the tokens; reuse the scan count
+                tokens = result["tokens"] = result["tokens"] or tokens
+                result["bytes"] = len(source.encode())
+                results[f"{shape}/{name}"] = result
+                report(f"{shape}/{name}", result)
+    return results
+
+def report(name: str, result: dict):
+    seconds = result["seconds"]
+    print(
+        f"{name:<26} {seconds * 1000:9.1f} ms"
+        f" {result['tokens'] / seconds / 1e6:7.2f} Mtok/s"
+        f" {result['bytes'] / seconds / 1e6:7.2f} MB/s"
+        f" {result['peak'] / 1e6:8.1f} MB peak"
+    )
+
+# Returns the names of entries that got slower or bigger than allowed
+def compare(results: dict, baseline: dict, tolerance: float):
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        for key in ("seconds", "peak"):
+            if result[key] > old[key] * (1 + tolerance):
+                change = result[key] / old[key] - 1
+                print(f"REGRESSION {name} {key}: {old[key]:.4g} -> {result[key]:.4g} (+{change:.0%})")
+                regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.harness")
+    parser.add_argument("--shapes", default=",".join(SHAPES), help="comma-separated corpus shapes")
+    parser.add_argument("--size", type=int, default=1 << 20, help="corpus size in bytes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", metavar="FILE", help="write the results as a baseline")
+    parser.add_argument("--compare", metavar="FILE", help="fail on regressions against a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown, as a fraction")
+    args = parser.parse_args()
+
+    shapes = args.shapes.split(",")
+    for shape in shapes:
+        if shape not in SHAPES:
+            parser.error(f"unknown shape: {shape}")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if (baseline["size"], baseline["seed"]) != (args.size, args.seed):
+            parser.error(f"baseline was recorded with --size {baseline['size']} --seed {baseline['seed']}")
+
+    results = run(shapes, args.size, args.seed, args.repeat)
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump({
+                "size": args.size,
+                "seed": args.seed,
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "results": results,
+            }, file, indent=2)
+            file.write("\n")
+
+    if baseline is not None:
+        regressions = compare(results, baseline["results"], args.tolerance)
+        if regressions:
+            exit(1)
+        print("No regressions")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# Counts Python-level function calls per token for each parser engine.
+#
+#   python -m benchmarks.parser_calls [operands]
+import random
+import sys
+import time
+
+from main import PARSERS, RegexScanner
+
+def make_source(operands: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts = []
+    for _ in range(operands):
+        operand = str(rng.randint(0, 99))
+        if rng.random() < 0.2:
+            operand = f"-{operand}"
+        if rng.random() < 0.2:
+            operand = f"({operand} {rng.choice('+-*/')} {rng.randint(1, 9)})"
+        parts.append(operand)
+        parts.append(rng.choice(["+", "-", "*", "/", "==", "!=", "<", ">="]))
+    parts.append("1")
+    return " ".join(parts)
+
+def count_calls(parser_class, tokens) -> int:
+    calls = 0
+
+    def profile(frame, event, arg):
+        nonlocal calls
+        if event == "call":
+            calls += 1
+
+    sys.setprofile(profile)
+    try:
+        parser_class(tokens).parse()
+    finally:
+        sys.setprofile(None)
+    return calls
+
+def main():
+    operands = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    tokens, _ = RegexScanner(make_source(operands)).scan_buffer()
+    print(f"{len(tokens)} tokens")
+    for name, parser_class in PARSERS.items():
+        calls = count_calls(parser_class, tokens)
+        start = time.perf_counter()
+        parser_class(tokens).parse()
+        elapsed = time.perf_counter() - start
+        print(f"{name:>10}: {calls / len(tokens):6.1f} calls/token  {elapsed:.3f}s")
+
+if __name__ == "__main__":
+    main()
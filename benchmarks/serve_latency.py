@@ -0,0 +1,67 @@
+# Per-request latency of a warm `main.py serve` against cold starts of
+# main.py. "client" runs client.py as a new process, as CI would; "request"
+# is the socket round trip alone, from an already running process.
+#
+#   python -m benchmarks.serve_latency [requests] [command]
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE = "var total = (count + 12) - index;\nprint total * 2;\n" * 20
+
+def timed(function, count):
+    times = []
+    for _ in range(count):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    command = sys.argv[2] if len(sys.argv) > 2 else "tokenize"
+    sys.path.insert(0, ROOT)
+    import client
+    import server
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "serve.sock")
+    filename = os.path.join(directory, "bench.lox")
+    with open(filename, "w") as file:
+        file.write(SOURCE)
+    environment = dict(os.environ, LOX_SOCKET=path)
+    args = [command, filename]
+
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "main.py"), "serve"],
+        env=environment,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while not server.is_serving(path):
+            time.sleep(0.01)
+        runs = {
+            "cold": lambda: subprocess.run(
+                [sys.executable, os.path.join(ROOT, "main.py")] + args,
+                env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            ),
+            "client": lambda: subprocess.run(
+                [sys.executable, os.path.join(ROOT, "client.py")] + args,
+                env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            ),
+            "request": lambda: client.request(args, path=path),
+        }
+        for name, run in runs.items():
+            times = sorted(timed(run, count))
+            p90 = times[int(len(times) * 0.9) - 1]
+            print(f"{name:>8}: median {statistics.median(times):7.2f} ms   p90 {p90:7.2f} ms")
+    finally:
+        process.terminate()
+        process.wait()
+
+if __name__ == "__main__":
+    main()
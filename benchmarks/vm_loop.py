@@ -0,0 +1,173 @@
+# Loop-heavy microbenchmark: the bytecode VM against a plain tree walker
+# over the same parsed program.
+#
+#   python -m benchmarks.vm_loop [iterations]
+import io
+import sys
+import time
+
+from main import LoxRuntimeError, RegexScanner, divide, is_equal, stringify
+from vm import VM, Compiler, ProgramParser
+
+PROGRAM = """
+var total = 0;
+for (var i = 0; i < {n}; i = i + 1) {{
+    var j = i * 2;
+    if (j > 10 and i != 3) {{
+        total = total + j - 1;
+    }} else {{
+        total = total - 1;
+    }}
+}}
+print total;
+"""
+
+class Environment:
+    def __init__(self, enclosing=None):
+        self.values = {}
+        self.enclosing = enclosing
+
+    def get(self, name):
+        env = self
+        while env is not None:
+            if name.lexeme in env.values:
+                return env.values[name.lexeme]
+            env = env.enclosing
+        raise LoxRuntimeError(f"Undefined variable '{name.lexeme}'.", name.line)
+
+    def assign(self, name, value):
+        env = self
+        while env is not None:
+            if name.lexeme in env.values:
+                env.values[name.lexeme] = value
+                return
+            env = env.enclosing
+        raise LoxRuntimeError(f"Undefined variable '{name.lexeme}'.", name.line)
+
+# Straightforward visitor: dispatches on node type and looks variables up by
+# name through a chain of dicts on every access.
+class TreeWalker:
+    def __init__(self, out):
+        self.environment = Environment()
+        self.out = out
+
+    def execute(self, stmt):
+        getattr(self, "visit_" + type(stmt).__name__)(stmt)
+
+    def evaluate(self, expr):
+        return getattr(self, "visit_" + type(expr).__name__)(expr)
+
+    def visit_Expression(self, stmt):
+        self.evaluate(stmt.expression)
+
+    def visit_Print(self, stmt):
+        self.out.write(stringify(self.evaluate(stmt.expression)) + "\n")
+
+    def visit_Var(self, stmt):
+        value = None if stmt.initializer is None else self.evaluate(stmt.initializer)
+        self.environment.values[stmt.name.lexeme] = value
+
+    def visit_Block(self, stmt):
+        previous = self.environment
+        self.environment = Environment(previous)
+        try:
+            for inner in stmt.statements:
+                self.execute(inner)
+        finally:
+            self.environment = previous
+
+    def visit_If(self, stmt):
+        condition = self.evaluate(stmt.condition)
+        if condition is not None and condition is not False:
+            self.execute(stmt.then_branch)
+        elif stmt.else_branch is not None:
+            self.execute(stmt.else_branch)
+
+    def visit_While(self, stmt):
+        while True:
+            condition = self.evaluate(stmt.condition)
+            if condition is None or condition is False:
+                break
+            self.execute(stmt.body)
+
+    def visit_Literal(self, expr):
+        return float(expr.value) if type(expr.value) is int else expr.value
+
+    def visit_Grouping(self, expr):
+        return self.evaluate(expr.expression)
+
+    def visit_Variable(self, expr):
+        return self.environment.get(expr.name)
+
+    def visit_Assign(self, expr):
+        value = self.evaluate(expr.value)
+        self.environment.assign(expr.name, value)
+        return value
+
+    def visit_Logical(self, expr):
+        left = self.evaluate(expr.left)
+        truthy = left is not None and left is not False
+        if expr.operator.type == "OR" and truthy or expr.operator.type == "AND" and not truthy:
+            return left
+        return self.evaluate(expr.right)
+
+    def visit_Unary(self, expr):
+        right = self.evaluate(expr.right)
+        if expr.operator.type == "BANG":
+            return right is None or right is False
+        if type(right) is not float:
+            raise LoxRuntimeError("Operand must be a number.", expr.operator.line)
+        return -right
+
+    def visit_Binary(self, expr):
+        left = self.evaluate(expr.left)
+        right = self.evaluate(expr.right)
+        type_ = expr.operator.type
+        if type_ == "EQUAL_EQUAL":
+            return is_equal(left, right)
+        if type_ == "BANG_EQUAL":
+            return not is_equal(left, right)
+        if type_ == "PLUS":
+            if type(left) is type(right) and type(left) in (float, str):
+                return left + right
+            raise LoxRuntimeError("Operands must be two numbers or two strings.", expr.operator.line)
+        if type(left) is not float or type(right) is not float:
+            raise LoxRuntimeError("Operands must be numbers.", expr.operator.line)
+        if type_ == "MINUS":
+            return left - right
+        if type_ == "STAR":
+            return left * right
+        if type_ == "SLASH":
+            return divide(left, right)
+        if type_ == "GREATER":
+            return left > right
+        if type_ == "GREATER_EQUAL":
+            return left >= right
+        if type_ == "LESS":
+            return left < right
+        return left <= right
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    tokens, _ = RegexScanner(PROGRAM.format(n=iterations)).scan_buffer()
+    statements = ProgramParser(tokens).parse()
+
+    out = io.StringIO()
+    start = time.perf_counter()
+    walker = TreeWalker(out)
+    for statement in statements:
+        walker.execute(statement)
+    walked = time.perf_counter() - start
+
+    vm_out = io.StringIO()
+    start = time.perf_counter()
+    VM(Compiler().compile(statements), vm_out).run()
+    ran = time.perf_counter() - start
+
+    assert out.getvalue() == vm_out.getvalue(), (out.getvalue(), vm_out.getvalue())
+    print(f"{iterations} iterations, result {vm_out.getvalue().strip()}")
+    print(f"tree walker: {walked:.3f}s")
+    print(f"bytecode VM: {ran:.3f}s ({walked / ran:.1f}x)")
+
+if __name__ == "__main__":
+    main()
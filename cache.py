@@ -0,0 +1,204 @@
+import hashlib
+import json
+import marshal
+import os
+import sys
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Content-addressed on-disk cache, in the spirit of __pycache__. Entries are
+# keyed by a hash of the source text, the kind of result stored and a
+# version string from the caller, so a scanner or parser change invalidates
+# them. Payloads are serialized with marshal; the Python version is part of
+# the key because the marshal format may change between releases.
+
+CACHE_DIR = os.environ.get("LOX_CACHE_DIR", ".loxcache")
+CACHE_SIZE = int(os.environ.get("LOX_CACHE_SIZE", 64 * 1024 * 1024))
+STATS_FILE = "stats.json"
+LOCK_FILE = "stats.lock"
+# Eviction goes down to this fraction of the limit, so the directory scan
+# it needs happens once per many puts rather than on every one
+LOW_WATER = 0.75
+
+class Cache:
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = CACHE_SIZE, version: str = ""):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = f"{version}:{sys.version_info[0]}.{sys.version_info[1]}"
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Running totals of the entries, loaded from the stats file on the
+        # first put, and what this run added to them since the last save.
+        # A scan replaces the stored totals instead of adding to them.
+        self.bytes = None
+        self.entries = 0
+        self.added_bytes = 0
+        self.added_entries = 0
+        self.scanned = False
+
+    def key(self, source: str, kind: str) -> str:
+        digest = hashlib.sha256(f"{self.version}:{kind}:".encode())
+        digest.update(source.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".bin")
+
+    def get(self, source: str, kind: str):
+        path = self.path(self.key(source, kind))
+        try:
+            with open(path, "rb") as file:
+                payload = marshal.load(file)
+            # Reads count as use: the mtime orders entries for LRU eviction
+            os.utime(path)
+        except (OSError, EOFError, ValueError, TypeError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return payload
+
+    def put(self, source: str, kind: str, payload):
+        os.makedirs(self.directory, exist_ok=True)
+        self.load_usage()
+        path = self.path(self.key(source, kind))
+        # Write to a private name first so readers never see a partial entry
+        temporary = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temporary, "wb") as file:
+                marshal.dump(payload, file)
+                size = file.tell()
+            try:
+                replaced = os.stat(path).st_size
+            except OSError:
+                replaced = None
+            os.replace(temporary, path)
+        except (OSError, ValueError):
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+            return
+        added_bytes = size - (replaced or 0)
+        added_entries = 1 if replaced is None else 0
+        self.bytes += added_bytes
+        self.entries += added_entries
+        self.added_bytes += added_bytes
+        self.added_entries += added_entries
+        if self.bytes > self.max_bytes:
+            self.evict()
+
+    def load_usage(self):
+        if self.bytes is not None:
+            return
+        stats = load_stats(self.directory)
+        if stats["bytes"] is None:
+            self.scan()
+        else:
+            self.bytes = stats["bytes"]
+            self.entries = stats["entries"]
+
+    # Lists the entries as (mtime, size, path) and resets the running totals
+    # to what is actually on disk
+    def scan(self):
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if not entry.name.endswith(".bin"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        self.bytes = sum(size for _, size, _ in entries)
+        self.entries = len(entries)
+        self.added_bytes = self.added_entries = 0
+        self.scanned = True
+        return entries
+
+    def evict(self):
+        entries = self.scan()
+        if self.bytes <= self.max_bytes:
+            return
+        entries.sort()
+        target = self.max_bytes * LOW_WATER
+        for _, size, path in entries:
+            if self.bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.bytes -= size
+            self.entries -= 1
+            self.evictions += 1
+
+    def save_stats(self):
+        # Adds this run's counters to the cumulative ones in the cache
+        # directory. The running size is what eviction relies on, so the
+        # update is made under a lock where the platform has flock;
+        # elsewhere concurrent runs may occasionally lose an update.
+        if not (self.hits or self.misses or self.evictions or self.added_entries or self.scanned):
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            lock = open(os.path.join(self.directory, LOCK_FILE), "a")
+        except OSError:
+            return
+        with lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            self.write_stats()
+
+    def write_stats(self):
+        stats = load_stats(self.directory)
+        stats["hits"] += self.hits
+        stats["misses"] += self.misses
+        stats["evictions"] += self.evictions
+        if self.scanned or stats["bytes"] is None:
+            stats["bytes"] = self.bytes
+            stats["entries"] = self.entries
+        else:
+            stats["bytes"] += self.added_bytes
+            stats["entries"] += self.added_entries
+        path = os.path.join(self.directory, STATS_FILE)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temporary, "w") as file:
+                json.dump(stats, file)
+            os.replace(temporary, path)
+        except OSError:
+            return
+        self.hits = self.misses = self.evictions = 0
+        self.added_bytes = self.added_entries = 0
+        self.scanned = False
+
+def load_stats(directory: str = CACHE_DIR) -> dict:
+    stats = {"hits": 0, "misses": 0, "evictions": 0, "bytes": None, "entries": None}
+    try:
+        with open(os.path.join(directory, STATS_FILE)) as file:
+            stats.update(json.load(file))
+    except (OSError, ValueError):
+        pass
+    return stats
+
+# Prints the cumulative counters and the current size of the cache
+def main():
+    directory = sys.argv[1] if len(sys.argv) > 1 else CACHE_DIR
+    stats = load_stats(directory)
+    entries = size = 0
+    if os.path.isdir(directory):
+        with os.scandir(directory) as scan:
+            for entry in scan:
+                if entry.name.endswith(".bin"):
+                    entries += 1
+                    size += entry.stat().st_size
+    print(f"hits {stats['hits']} misses {stats['misses']} evictions {stats['evictions']}")
+    print(f"{entries} entries, {size} bytes in {directory}")
+
+if __name__ == "__main__":
+    main()
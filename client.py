@@ -0,0 +1,44 @@
+import json
+import os
+import socket
+import sys
+
+from server import SOCKET_PATH, read_frame, write_frame
+
+# Thin client for `main.py serve`: sends its command line to the server and
+# replays the answer. When no server is listening it runs main.py in this
+# process instead, so it can stand in for main.py anywhere.
+
+# Returns (stdout, stderr, status), or None when no server answered
+def request(args, source=None, path=SOCKET_PATH):
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with connection:
+        try:
+            connection.connect(path)
+            message = {"args": args, "cwd": os.getcwd(), "source": source}
+            write_frame(connection, json.dumps(message).encode())
+            status = json.loads(read_frame(connection))["status"]
+            return read_frame(connection), read_frame(connection), status
+        except (OSError, EOFError):
+            return None
+
+def main():
+    args = sys.argv[1:]
+    # The server cannot read our stdin, so a "-" source goes with the request
+    source = sys.stdin.read() if "-" in args else None
+    response = request(args, source)
+    if response is None:
+        import io
+        import main as lox
+        if source is not None:
+            sys.stdin = io.StringIO(source)
+        lox.main(args)
+        return
+    out, err, status = response
+    sys.stdout.buffer.write(out)
+    sys.stdout.flush()
+    sys.stderr.buffer.write(err)
+    exit(status)
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,20 @@
+import contextlib
+import glob
+import io
+import itertools
+import json
+import math
+import operator
+import os
+import re
+import struct
 import sys
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+
+from cache import Cache
 
 # Keywords mapping
 KEYWORDS = {
@@ -20,13 +36,34 @@ KEYWORDS = {
     "while": "WHILE",
 }
 
+# Token types, numbered by position for compact storage in TokenBuffer
+TOKEN_TYPES = (
+    "EOF",
+    "LEFT_PAREN", "RIGHT_PAREN", "LEFT_BRACE", "RIGHT_BRACE",
+    "COMMA", "DOT", "MINUS", "PLUS", "SEMICOLON", "SLASH", "STAR",
+    "BANG", "BANG_EQUAL", "EQUAL", "EQUAL_EQUAL",
+    "GREATER", "GREATER_EQUAL", "LESS", "LESS_EQUAL",
+    "IDENTIFIER", "STRING", "NUMBER",
+    *KEYWORDS.values(),
+)
+TOKEN_TYPE_IDS = {type: id for id, type in enumerate(TOKEN_TYPES)}
+
 # Token class
 class Token:
-    def __init__(self, type: str, lexeme: str, literal, line: int):
+    __slots__ = ("type", "lexeme", "literal", "line", "start", "symbol")
+
+    def __init__(self, type: str, lexeme: str, literal, line: int, start: int = 0, symbol: int = -1):
         self.type = type
         self.lexeme = lexeme
         self.literal = literal
         self.line = line
+        self.start = start
+        # SymbolTable id of an identifier, -1 for other tokens
+        self.symbol = symbol
+
+    @property
+    def length(self) -> int:
+        return len(self.lexeme)
 
     def __str__(self):
         if self.type == "NUMBER":
@@ -36,6 +73,182 @@ class Token:
             literal_str = "null" if self.literal is None else str(self.literal)
         return f"{self.type} {self.lexeme} {literal_str}"
 
+# Identifier names seen in one run, each with a small id in order of first
+# appearance and a single shared string
+class SymbolTable:
+    __slots__ = ("ids", "names")
+
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+
+    def intern(self, name: str) -> int:
+        id = self.ids.get(name)
+        if id is None:
+            id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return id
+
+    def __len__(self):
+        return len(self.names)
+
+def make_literal(type: str, lexeme: str):
+    if type == "NUMBER":
+        return float(lexeme) if "." in lexeme else int(lexeme)
+    if type == "STRING":
+        return lexeme[1:-1]
+    return None
+
+# Struct-of-arrays token storage: a type id, source offsets and a line per
+# token. Lexemes and literals are sliced from the source only when asked for.
+# When streaming, source is the current chunk and base its offset in the
+# whole input.
+class TokenBuffer:
+    __slots__ = ("source", "base", "kinds", "starts", "ends", "lines", "symbols")
+
+    def __init__(self, source: str, symbols=None):
+        self.source = source
+        self.base = 0
+        self.kinds = array("B")
+        self.starts = array("q")
+        self.ends = array("q")
+        self.lines = array("i")
+        self.symbols = symbols if symbols is not None else SymbolTable()
+
+    def append(self, kind: int, start: int, end: int, line: int):
+        self.kinds.append(kind)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.lines.append(line)
+
+    def truncate(self, length: int):
+        del self.kinds[length:]
+        del self.starts[length:]
+        del self.ends[length:]
+        del self.lines[length:]
+
+    def clear(self):
+        self.truncate(0)
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, index: int):
+        if index < 0:
+            index += len(self.kinds)
+        if not 0 <= index < len(self.kinds):
+            raise IndexError("token index out of range")
+        return TokenView(self, index)
+
+    def __iter__(self):
+        return map(TokenView, [self] * len(self.kinds), range(len(self.kinds)))
+
+    def token(self, index: int) -> Token:
+        kind = self.kinds[index]
+        type = TOKEN_TYPES[kind]
+        lexeme = FIXED_LEXEMES[kind]
+        symbol = -1
+        if lexeme is None:
+            lexeme = self.source[self.starts[index]:self.ends[index]]
+            if kind == IDENTIFIER_ID:
+                symbol = self.symbols.intern(lexeme)
+                lexeme = self.symbols.names[symbol]
+        return Token(type, lexeme, make_literal(type, lexeme), self.lines[index], self.base + self.starts[index], symbol)
+
+    def tokens(self):
+        return map(self.token, range(len(self.kinds)))
+
+# Token-like view of one TokenBuffer entry, for Parser and printing
+class TokenView:
+    __slots__ = ("buffer", "index")
+
+    def __init__(self, buffer: TokenBuffer, index: int):
+        self.buffer = buffer
+        self.index = index
+
+    @property
+    def type(self) -> str:
+        return TOKEN_TYPES[self.buffer.kinds[self.index]]
+
+    @property
+    def lexeme(self) -> str:
+        buffer = self.buffer
+        return buffer.source[buffer.starts[self.index]:buffer.ends[self.index]]
+
+    @property
+    def literal(self):
+        return make_literal(self.type, self.lexeme)
+
+    @property
+    def line(self) -> int:
+        return self.buffer.lines[self.index]
+
+    @property
+    def start(self) -> int:
+        return self.buffer.base + self.buffer.starts[self.index]
+
+    @property
+    def length(self) -> int:
+        return self.buffer.ends[self.index] - self.buffer.starts[self.index]
+
+    @property
+    def symbol(self) -> int:
+        if self.buffer.kinds[self.index] != IDENTIFIER_ID:
+            return -1
+        return self.buffer.symbols.intern(self.lexeme)
+
+    __str__ = Token.__str__
+
+# Newline offsets of a source, found once, for offset -> (line, column) and
+# line -> offset lookups by bisection. Lines and columns start at 1; columns
+# count characters.
+class LineIndex:
+    __slots__ = ("newlines", "length")
+
+    def __init__(self, source: str):
+        self.newlines = newlines = array("q")
+        self.length = len(source)
+        find = source.find
+        position = find("\n")
+        while position >= 0:
+            newlines.append(position)
+            position = find("\n", position + 1)
+
+    def position(self, offset: int):
+        line = bisect_left(self.newlines, offset)
+        start = self.newlines[line - 1] + 1 if line else 0
+        return line + 1, offset - start + 1
+
+    def offset(self, line: int) -> int:
+        # Start of a line; past the last line, the end of the source
+        if line <= 1:
+            return 0
+        if line - 2 >= len(self.newlines):
+            return self.length
+        return self.newlines[line - 2] + 1
+
+    def __len__(self):
+        # Number of lines
+        return len(self.newlines) + 1
+
+# A scan error: the offset of the offending character (for an unterminated
+# string, its opening quote), the line it is reported on and the message
+class ScanError:
+    __slots__ = ("position", "line", "message")
+
+    def __init__(self, position: int, line: int, message: str):
+        self.position = position
+        self.line = line
+        self.message = message
+
+    def __str__(self):
+        return f"[line {self.line}] Error: {self.message}"
+
+    def format(self, index: LineIndex) -> str:
+        # With the column, taken at the error's position
+        line, column = index.position(self.position)
+        return f"[line {line}, column {column}] Error: {self.message}"
+
 # Scanner class
 class Scanner:
     def __init__(self, source: str):
@@ -45,12 +258,15 @@ class Scanner:
         self.current = 0
         self.line = 1
         self.errors = []
+        # Offset of source in the whole input, when it is scanned in chunks
+        self.base = 0
+        self.symbols = SymbolTable()
 
     def scan_tokens(self):
         while not self.is_at_end():
             self.start = self.current
             self.scan_token()
-        self.tokens.append(Token("EOF", "", None, self.line))
+        self.tokens.append(Token("EOF", "", None, self.line, self.current))
         return self.tokens, self.errors
 
     def is_at_end(self) -> bool:
@@ -168,21 +384,425 @@ class Scanner:
 
     def add_token(self, type: str, literal=None):
         text = self.source[self.start:self.current]
-        self.tokens.append(Token(type, text, literal, self.line))
+        symbol = -1
+        if type == "IDENTIFIER":
+            symbol = self.symbols.intern(text)
+            text = self.symbols.names[symbol]
+        else:
+            text = SHARED_LEXEMES.get(text, text)
+        self.tokens.append(Token(type, text, literal, self.line, self.start, symbol))
+
+    def error(self, message: str):
+        self.errors.append(ScanError(self.base + self.start, self.line, message))
+
+# Regex engine: one master pattern, matched once per lexeme
+TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<identifier>[A-Za-z_]\w*)
+    |(?P<space>[ \t\r]+)
+    |(?P<comment>//[^\n]*)
+    |(?P<operator>!=|==|<=|>=|[(){},.\-+;*=!<>/])
+    |(?P<number>[0-9]\d*(?:\.\d+)?)
+    |(?P<newline>[ \t\r]*\n[ \t\r\n]*)
+    |(?P<string>"[^"]*")
+    |(?P<unterminated>"[^"]*)
+    |(?P<other>.)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+# Characters read per chunk by RegexScanner.iter_tokens
+CHUNK_SIZE = 1 << 16
+
+IDENTIFIER, SPACE, COMMENT, OPERATOR, NUMBER, NEWLINE, STRING, UNTERMINATED = range(1, 9)
+
+EOF_ID = TOKEN_TYPE_IDS["EOF"]
+IDENTIFIER_ID = TOKEN_TYPE_IDS["IDENTIFIER"]
+NUMBER_ID = TOKEN_TYPE_IDS["NUMBER"]
+STRING_ID = TOKEN_TYPE_IDS["STRING"]
+KEYWORD_IDS = {text: TOKEN_TYPE_IDS[type] for text, type in KEYWORDS.items()}
+
+OPERATORS = {
+    "(": "LEFT_PAREN",
+    ")": "RIGHT_PAREN",
+    "{": "LEFT_BRACE",
+    "}": "RIGHT_BRACE",
+    ",": "COMMA",
+    ".": "DOT",
+    "-": "MINUS",
+    "+": "PLUS",
+    ";": "SEMICOLON",
+    "*": "STAR",
+    "/": "SLASH",
+    "=": "EQUAL",
+    "==": "EQUAL_EQUAL",
+    "!": "BANG",
+    "!=": "BANG_EQUAL",
+    ">": "GREATER",
+    ">=": "GREATER_EQUAL",
+    "<": "LESS",
+    "<=": "LESS_EQUAL",
+}
+OPERATOR_IDS = {text: TOKEN_TYPE_IDS[type] for text, type in OPERATORS.items()}
+
+# Keyword and operator lexemes are always the same text, so tokens share
+# one string per kind instead of slicing the source
+SHARED_LEXEMES = {text: text for text in itertools.chain(KEYWORDS, OPERATORS, [""])}
+FIXED_LEXEMES = [None] * len(TOKEN_TYPES)
+for text, kind in itertools.chain(KEYWORD_IDS.items(), OPERATOR_IDS.items(), [("", EOF_ID)]):
+    FIXED_LEXEMES[kind] = text
+
+# Scanner that consumes whole lexemes with TOKEN_PATTERN instead of
+# dispatching per character, recording them in a TokenBuffer. Anything
+# outside ASCII falls back to the classic scan_token so the output stays
+# identical.
+class RegexScanner(Scanner):
+    def __init__(self, source: str):
+        super().__init__(source)
+        self.buffer = TokenBuffer(source, self.symbols)
+
+    def scan_tokens(self):
+        buffer, _ = self.scan_buffer()
+        self.tokens.extend(buffer.tokens())
+        return self.tokens, self.errors
+
+    def scan_buffer(self):
+        self.buffer.source = self.source
+        self.scan_until(len(self.source))
+        self.buffer.append(EOF_ID, self.current, self.current, self.line)
+        return self.buffer, self.errors
+
+    def iter_tokens(self, stream, chunk_size: int = CHUNK_SIZE):
+        for buffer in self.iter_buffers(stream, chunk_size):
+            yield from buffer.tokens()
+
+    def iter_buffers(self, stream, chunk_size: int = CHUNK_SIZE):
+        # Reads stream chunk by chunk and yields the tokens completed so far.
+        # A lexeme may only end two characters before the end of the buffer
+        # (enough lookahead for "==" and "1.5"); anything later, including
+        # open strings and comments, is carried into the next chunk. The same
+        # TokenBuffer is yielded each time and cleared afterwards.
+        buffer = self.buffer
+        size = chunk_size
+        while True:
+            chunk = stream.read(size)
+            self.base = buffer.base = self.base + self.current
+            self.source = buffer.source = self.source[self.current:] + chunk
+            self.current = 0
+            if not chunk:
+                self.scan_until(len(self.source))
+                buffer.append(EOF_ID, self.current, self.current, self.line)
+                yield buffer
+                buffer.clear()
+                break
+            self.scan_until(len(self.source) - 2)
+            yield buffer
+            buffer.clear()
+            # A single lexeme longer than the buffer: read more before rescanning it
+            size = chunk_size if self.current else size * 2
+
+    def scan_until(self, limit: int):
+        source = self.source
+        length = len(source)
+        match = TOKEN_PATTERN.match
+        buffer = self.buffer
+        kinds_append = buffer.kinds.append
+        starts_append = buffer.starts.append
+        ends_append = buffer.ends.append
+        lines_append = buffer.lines.append
+        operator_ids = OPERATOR_IDS
+        keyword_ids = KEYWORD_IDS
+        pos = self.current
+        line = self.line
+
+        while pos < length:
+            m = match(source, pos)
+            end = m.end()
+            if end > limit:
+                break
+            kind = m.lastindex
+            if kind == SPACE or kind == COMMENT:
+                pos = end
+                continue
+            elif kind == IDENTIFIER:
+                kinds_append(keyword_ids.get(m.group(), IDENTIFIER_ID))
+            elif kind == OPERATOR:
+                kinds_append(operator_ids[m.group()])
+            elif kind == NUMBER:
+                kinds_append(NUMBER_ID)
+            elif kind == NEWLINE:
+                line += source.count("\n", pos, end)
+                pos = end
+                continue
+            elif kind == STRING:
+                line += source.count("\n", pos, end)
+                kinds_append(STRING_ID)
+            elif kind == UNTERMINATED:
+                line += source.count("\n", pos, end)
+                self.line = line
+                self.start = pos
+                self.current = end
+                self.error("Unterminated string.")
+                pos = end
+                continue
+            else:
+                token_count, error_count = len(buffer), len(self.errors)
+                self.start = self.current = pos
+                self.line = line
+                self.scan_token()
+                if self.current > limit:
+                    buffer.truncate(token_count)
+                    del self.errors[error_count:]
+                    break
+                pos = self.current
+                line = self.line
+                continue
+            starts_append(pos)
+            ends_append(end)
+            lines_append(line)
+            pos = end
+
+        self.current = pos
+        self.line = line
+
+    def add_token(self, type: str, literal=None):
+        # Used by the classic fallback; literals are rebuilt from the lexeme
+        self.buffer.append(TOKEN_TYPE_IDS[type], self.start, self.current, self.line)
+
+# Incremental re-lexing for editors. After an edit, scanning restarts at the
+# end of the last token that the edit cannot have changed (regex lookahead is
+# at most two characters) and stops as soon as a new token ends where an old
+# token ended, shifted by the edit. The old tokens from there on are kept.
+#
+# Shifting them would cost time proportional to the rest of the file, so it
+# is deferred: tokens from index gap onwards store their offsets minus shift
+# and their lines minus line_shift. Only the tokens between the previous
+# edit and the current one are adjusted when the gap moves. Error positions
+# and lines are kept the same way, with their own gap.
+class IncrementalLexer(RegexScanner):
+    def __init__(self, source: str):
+        super().__init__(source)
+        self.scan_buffer()
+        self.stream = self.buffer
+        self.gap = len(self.stream)
+        self.shift = 0
+        self.line_shift = 0
+        self.error_positions = [position for position, _, _, _ in self.errors]
+        self.error_lines = [line for _, line, _, _ in self.errors]
+        self.error_messages = [message for _, _, message, _ in self.errors]
+        self.error_starts = [start for _, _, _, start in self.errors]
+        self.error_gap = len(self.errors)
+
+    def edit(self, offset: int, deleted: int, text: str):
+        # Returns the index of the first changed token and how many tokens
+        # were removed and inserted there
+        stream = self.stream
+        source = self.source[:offset] + text + self.source[offset + deleted:]
+        delta = len(text) - deleted
+        line_delta = text.count("\n") - self.source.count("\n", offset, offset + deleted)
+        edit_end = offset + len(text)
+        last = len(stream) - 1
+        ends = stream.ends
+        shift = self.shift
+
+        # First token that may have changed, then bring the gaps there
+        first = bisect_right(ends, offset - 2, 0, self.gap)
+        if first == self.gap:
+            first = bisect_right(ends, offset - 2 - shift, self.gap, last)
+        self.move_gap(first)
+        restart, line = (ends[first - 1], stream.lines[first - 1]) if first else (0, 1)
+        positions = self.error_positions
+        first_error = bisect_right(positions, restart, 0, self.error_gap)
+        if first_error == self.error_gap:
+            first_error = bisect_right(positions, restart - shift, self.error_gap)
+        self.move_error_gap(first_error)
+
+        self.source = stream.source = source
+        self.buffer = scratch = TokenBuffer(source, self.symbols)
+        self.current = restart
+        self.line = line
+        self.errors = []
+        window = 256
+        checked = 0
+        resync = None
+        while resync is None:
+            limit = min(edit_end + window, len(source))
+            self.scan_until(limit)
+            for index in range(checked, len(scratch)):
+                end = scratch.ends[index]
+                if end < edit_end:
+                    continue
+                old = bisect_left(ends, end - delta - shift, first, last)
+                if old < last and ends[old] == end - delta - shift:
+                    resync = (index + 1, old + 1, end)
+                    break
+            checked = len(scratch)
+            if resync is None and limit == len(source):
+                scratch.append(EOF_ID, self.current, self.current, self.line)
+                resync = (len(scratch), len(stream), None)
+            window *= 2
+        self.buffer = stream
+
+        count, stop, end = resync
+        stream.kinds[first:stop] = scratch.kinds[:count]
+        stream.starts[first:stop] = scratch.starts[:count]
+        stream.ends[first:stop] = scratch.ends[:count]
+        stream.lines[first:stop] = scratch.lines[:count]
+        self.gap = first + count
+        if end is None:
+            errors = self.errors
+            stop_error = len(positions)
+            self.shift = self.line_shift = 0
+        else:
+            errors = [error for error in self.errors if error[0] <= end]
+            stop_error = bisect_right(positions, end - delta - shift, first_error)
+            self.shift += delta
+            self.line_shift += line_delta
+        positions[first_error:stop_error] = [position for position, _, _, _ in errors]
+        self.error_lines[first_error:stop_error] = [line for _, line, _, _ in errors]
+        self.error_messages[first_error:stop_error] = [message for _, _, message, _ in errors]
+        self.error_starts[first_error:stop_error] = [start for _, _, _, start in errors]
+        self.error_gap = first_error + len(errors)
+        return first, stop - first, count
+
+    def move_gap(self, index: int):
+        stream = self.stream
+        starts, ends, lines = stream.starts, stream.ends, stream.lines
+        shift, line_shift = self.shift, self.line_shift
+        if shift or line_shift:
+            for i in range(self.gap, index):
+                starts[i] += shift
+                ends[i] += shift
+                lines[i] += line_shift
+            for i in range(index, self.gap):
+                starts[i] -= shift
+                ends[i] -= shift
+                lines[i] -= line_shift
+        self.gap = index
+
+    def move_error_gap(self, index: int):
+        positions, lines, starts = self.error_positions, self.error_lines, self.error_starts
+        shift, line_shift = self.shift, self.line_shift
+        if shift or line_shift:
+            for i in range(self.error_gap, index):
+                positions[i] += shift
+                lines[i] += line_shift
+                starts[i] += shift
+            for i in range(index, self.error_gap):
+                positions[i] -= shift
+                lines[i] -= line_shift
+                starts[i] -= shift
+        self.error_gap = index
+
+    def token(self, index: int) -> Token:
+        stream = self.stream
+        if index < self.gap:
+            return stream.token(index)
+        start = stream.starts[index] + self.shift
+        end = stream.ends[index] + self.shift
+        kind = stream.kinds[index]
+        type = TOKEN_TYPES[kind]
+        lexeme = FIXED_LEXEMES[kind]
+        symbol = -1
+        if lexeme is None:
+            lexeme = self.source[start:end]
+            if kind == IDENTIFIER_ID:
+                symbol = self.symbols.intern(lexeme)
+                lexeme = self.symbols.names[symbol]
+        return Token(type, lexeme, make_literal(type, lexeme), stream.lines[index] + self.line_shift, start, symbol)
+
+    def scan_tokens(self):
+        # Same result as a full scan of the current source
+        self.move_gap(len(self.stream))
+        self.move_error_gap(len(self.error_positions))
+        self.errors = list(map(ScanError, self.error_starts, self.error_lines, self.error_messages))
+        return list(self.stream.tokens()), self.errors
 
     def error(self, message: str):
-        self.errors.append(f"[line {self.line}] Error: {message}")
+        # Made into ScanErrors by scan_tokens, once positions and lines are final
+        self.errors.append((self.current, self.line, message, self.start))
+
+ENGINES = {
+    "classic": Scanner,
+    "regex": RegexScanner,
+}
+
+# Expression nodes
+class Binary:
+    __slots__ = ("left", "operator", "right")
+
+    def __init__(self, left, operator, right):
+        self.left = left
+        self.operator = operator
+        self.right = right
+
+class Unary:
+    __slots__ = ("operator", "right")
+
+    def __init__(self, operator, right):
+        self.operator = operator
+        self.right = right
+
+class Grouping:
+    __slots__ = ("expression",)
+
+    def __init__(self, expression):
+        self.expression = expression
+
+class Literal:
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+def format_literal(value) -> str:
+    if value is None:
+        return "nil"
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if isinstance(value, str):
+        return value
+    return f"{float(value):.1f}"
+
+# Writes an expression tree as an s-expression in one pass. Uses an explicit
+# stack, so long operator chains and deep nesting print without recursion.
+class AstPrinter:
+    def print(self, expr) -> str:
+        parts = []
+        stack = [expr]
+        while stack:
+            node = stack.pop()
+            if type(node) is str:
+                parts.append(node)
+            elif type(node) is Binary:
+                stack += (")", node.right, " ", node.left, f"({node.operator.lexeme} ")
+            elif type(node) is Unary:
+                stack += (")", node.right, f"({node.operator.lexeme} ")
+            elif type(node) is Grouping:
+                stack += (")", node.expression, "(group ")
+            elif type(node) is Literal:
+                parts.append(format_literal(node.value))
+            else:
+                parts.append(str(node))
+        return "".join(parts)
 
 # Parser class
 class Parser:
     def __init__(self, tokens):
         self.tokens = tokens
         self.current = 0
+        self.errors = []
 
     def parse(self):
         statements = []
         while not self.is_at_end():
+            start = self.current
             statements.append(self.expression())
+            if self.current == start:
+                # Nothing could start an expression here; skip the token
+                self.advance()
         return statements
 
     def expression(self):
@@ -193,7 +813,7 @@ class Parser:
         while self.match("BANG_EQUAL", "EQUAL_EQUAL"):
             operator = self.previous()
             right = self.comparison()
-            expr = f"({operator.lexeme} {expr} {right})"
+            expr = Binary(expr, operator, right)
         return expr
 
     def comparison(self):
@@ -201,7 +821,7 @@ class Parser:
         while self.match("GREATER", "GREATER_EQUAL", "LESS", "LESS_EQUAL"):
             operator = self.previous()
             right = self.term()
-            expr = f"({operator.lexeme} {expr} {right})"
+            expr = Binary(expr, operator, right)
         return expr
 
     def term(self):
@@ -209,7 +829,7 @@ class Parser:
         while self.match("PLUS", "MINUS"):
             operator = self.previous()
             right = self.factor()
-            expr = f"({operator.lexeme} {expr} {right})"
+            expr = Binary(expr, operator, right)
         return expr
 
     def factor(self):
@@ -217,25 +837,23 @@ class Parser:
         while self.match("STAR", "SLASH"):
             operator = self.previous()
             right = self.unary()
-            expr = f"({operator.lexeme} {expr} {right})"
+            expr = Binary(expr, operator, right)
         return expr
 
     def unary(self):
         if self.match("MINUS", "BANG"):
             operator = self.previous()
             right = self.unary()
-            return f"({operator.lexeme} {right})"
+            return Unary(operator, right)
         return self.primary()
 
     def primary(self):
-        if self.match("NUMBER"):
-            return f"{float(self.previous().literal):.1f}"
-        elif self.match("STRING"):
-            return self.previous().literal
+        if self.match("NUMBER", "STRING"):
+            return Literal(self.previous().literal)
         elif self.match("LEFT_PAREN"):
             expr = self.expression()
             self.consume("RIGHT_PAREN", "Expect ')' after expression.")
-            return f"(group {expr})"
+            return Grouping(expr)
         self.error("Expected expression.")
         return None
 
@@ -271,37 +889,997 @@ class Parser:
         self.error(message)
 
     def error(self, message: str):
+        self.errors.append(f"Error: {message}")
         print(f"Error: {message}")
 
+# Binding power of each binary operator; all of them are left-associative
+BINARY_PRECEDENCE = {
+    "BANG_EQUAL": 1, "EQUAL_EQUAL": 1,
+    "GREATER": 2, "GREATER_EQUAL": 2, "LESS": 2, "LESS_EQUAL": 2,
+    "MINUS": 3, "PLUS": 3,
+    "SLASH": 4, "STAR": 4,
+}
+PREFIX_PRECEDENCE = 5
+GROUP_MARKER = (0, None)
+
+# Precedence-climbing parser with explicit operand and operator stacks.
+# Produces the same trees and errors as Parser, but nesting depth is
+# bounded by memory instead of the recursion limit, and each token costs a
+# few loop iterations instead of a chain of method calls.
+class PrattParser(Parser):
+    def expression(self):
+        tokens = self.tokens
+        precedence_of = BINARY_PRECEDENCE.get
+        operands = []
+        operators = []
+
+        while True:
+            # Operand position: prefix operators and open parentheses, then a primary
+            while True:
+                token = tokens[self.current]
+                type = token.type
+                if type == "MINUS" or type == "BANG":
+                    operators.append((PREFIX_PRECEDENCE, token))
+                elif type == "LEFT_PAREN":
+                    operators.append(GROUP_MARKER)
+                else:
+                    break
+                self.current += 1
+
+            if type == "NUMBER" or type == "STRING":
+                self.current += 1
+                operands.append(Literal(token.literal))
+            else:
+                self.error("Expected expression.")
+                operands.append(None)
+
+            # Operator position: reduce until a binary operator continues the
+            # expression, or nothing is left open
+            while True:
+                token = tokens[self.current]
+                precedence = precedence_of(token.type, 1)
+                while operators and operators[-1][0] >= precedence:
+                    operator_precedence, operator = operators.pop()
+                    right = operands.pop()
+                    if operator_precedence == PREFIX_PRECEDENCE:
+                        operands.append(Unary(operator, right))
+                    else:
+                        operands.append(Binary(operands.pop(), operator, right))
+                if token.type in BINARY_PRECEDENCE:
+                    self.current += 1
+                    operators.append((precedence, token))
+                    break
+                if not operators:
+                    return operands.pop()
+                operators.pop()
+                self.consume("RIGHT_PAREN", "Expect ')' after expression.")
+                operands.append(Grouping(operands.pop()))
+
+PARSERS = {
+    "recursive": Parser,
+    "pratt": PrattParser,
+}
+
+class LoxRuntimeError(Exception):
+    def __init__(self, message: str, line: int):
+        super().__init__(message)
+        self.message = message
+        self.line = line
+
+def is_truthy(value) -> bool:
+    return value is not None and value is not False
+
+def is_equal(a, b) -> bool:
+    return type(a) is type(b) and a == b
+
+def stringify(value) -> str:
+    if value is None:
+        return "nil"
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if type(value) is float:
+        if value != value:
+            return "NaN"
+        if value in (math.inf, -math.inf):
+            return "Infinity" if value > 0 else "-Infinity"
+        text = repr(value)
+        return text[:-2] if text.endswith(".0") else text
+    return str(value)
+
+def divide(a: float, b: float) -> float:
+    if b == 0:
+        # IEEE 754 division, as in the reference Lox implementations
+        if a == 0 or a != a:
+            return math.nan
+        return math.copysign(math.inf, a) * math.copysign(1.0, b)
+    return a / b
+
+def binary_operation(token):
+    # Returns a two-argument function applying the operator token with
+    # Lox's type checks; runtime errors point at the token.
+    if token.type == "PLUS":
+        def operation(a, b):
+            if type(a) is type(b) and (type(a) is float or type(a) is str):
+                return a + b
+            raise LoxRuntimeError("Operands must be two numbers or two strings.", token.line)
+        return operation
+    if token.type == "EQUAL_EQUAL":
+        return is_equal
+    if token.type == "BANG_EQUAL":
+        return lambda a, b: not is_equal(a, b)
+
+    apply = NUMERIC_OPERATIONS[token.type]
+
+    def operation(a, b):
+        if type(a) is float and type(b) is float:
+            return apply(a, b)
+        raise LoxRuntimeError("Operands must be numbers.", token.line)
+    return operation
+
+NUMERIC_OPERATIONS = {
+    "MINUS": operator.sub,
+    "STAR": operator.mul,
+    "SLASH": divide,
+    "GREATER": operator.gt,
+    "GREATER_EQUAL": operator.ge,
+    "LESS": operator.lt,
+    "LESS_EQUAL": operator.le,
+}
+
+def unary_operation(token):
+    # Returns a one-argument function applying the operator token, as
+    # binary_operation does for two
+    if token.type == "BANG":
+        return lambda value: value is None or value is False
+
+    def operation(value):
+        if type(value) is not float:
+            raise LoxRuntimeError("Operand must be a number.", token.line)
+        return -value
+    return operation
+
+def ungroup(expr):
+    while type(expr) is Grouping:
+        expr = expr.expression
+    return expr
+
+# The parts ClosureCompiler turns into one closure: a run of prefix
+# operators and its operand, or a left-leaning operator chain as its first
+# operand and (operator, right operand) steps. Groupings are looked through.
+def unary_run(expr):
+    operators = []
+    while type(expr) is Unary:
+        operators.append(expr.operator)
+        expr = ungroup(expr.right)
+    return operators, expr
+
+def binary_chain(expr):
+    steps = []
+    while type(expr) is Binary:
+        steps.append((expr.operator, ungroup(expr.right)))
+        expr = ungroup(expr.left)
+    steps.reverse()
+    return expr, steps
+
+def closure_operands(expr):
+    if type(expr) is Unary:
+        return [unary_run(expr)[1]]
+    if type(expr) is Binary:
+        first, steps = binary_chain(expr)
+        return [first] + [right for _, right in steps]
+    return []
+
+# How deeply the closures for each operand nest, found without recursion
+def closure_depths(expr):
+    # Literals, the usual operands, are never pushed and count as 1
+    depths = {}
+    stack = [(expr, None)]
+    while stack:
+        node, operands = stack.pop()
+        if operands is not None:
+            depths[id(node)] = 1 + max(depths.get(id(operand), 1) for operand in operands)
+        elif type(node) is not Literal:
+            operands = closure_operands(node)
+            stack.append((node, operands))
+            stack += ((operand, None) for operand in operands if type(operand) is not Literal)
+    depths.setdefault(id(expr), 1)
+    return depths
+
+# Closures deeper than this would recurse too far, both when compiling and
+# when called
+CLOSURE_DEPTH = 100
+
+PUSH, APPLY_UNARY, APPLY_BINARY = range(3)
+
+# Compiles an expression tree once into nested closures; calling the result
+# evaluates it without dispatching on node types again. Left-leaning
+# operator chains and runs of prefix operators each become one closure
+# looping over their operands. Trees whose closures would nest deeper than
+# CLOSURE_DEPTH are compiled to a postfix program run on an explicit value
+# stack instead, with closures only for the subtrees shallow enough.
+class ClosureCompiler:
+    def compile(self, expr):
+        expr = ungroup(expr)
+        if type(expr) not in (Literal, Unary, Binary):
+            raise TypeError(f"Cannot compile {expr!r}")
+        depths = closure_depths(expr)
+        if depths[id(expr)] <= CLOSURE_DEPTH:
+            return self.closure(expr)
+        return self.program(expr, depths)
+
+    def closure(self, expr):
+        if type(expr) is Literal:
+            return self.literal(expr)
+        if type(expr) is Unary:
+            return self.unary(expr)
+        if type(expr) is Binary:
+            return self.binary(expr)
+        raise TypeError(f"Cannot compile {expr!r}")
+
+    def literal(self, expr: Literal):
+        value = expr.value
+        if type(value) is int:
+            value = float(value)
+        return lambda: value
+
+    def unary(self, expr: Unary):
+        operators, operand = unary_run(expr)
+        operations = [unary_operation(token) for token in reversed(operators)]
+        right = self.closure(operand)
+        if len(operations) == 1:
+            operation, = operations
+            return lambda: operation(right())
+
+        def evaluate():
+            value = right()
+            for operation in operations:
+                value = operation(value)
+            return value
+        return evaluate
+
+    def binary(self, expr: Binary):
+        first, steps = binary_chain(expr)
+        steps = [(binary_operation(token), self.closure(right)) for token, right in steps]
+        first = self.closure(first)
+
+        if len(steps) == 1:
+            (operation, right), = steps
+            return lambda: operation(first(), right())
+
+        def evaluate():
+            value = first()
+            for operation, right in steps:
+                value = operation(value, right())
+            return value
+        return evaluate
+
+    def program(self, expr, depths):
+        # Operands come before their operators, left before right, so
+        # evaluation order and the first error reported stay the same
+        program = []
+        work = [expr]
+        while work:
+            item = work.pop()
+            if type(item) is tuple:
+                program.append(item)
+            elif depths.get(id(item), 1) <= CLOSURE_DEPTH:
+                program.append((PUSH, self.closure(item)))
+            elif type(item) is Unary:
+                operators, operand = unary_run(item)
+                work += [(APPLY_UNARY, unary_operation(token)) for token in operators]
+                work.append(operand)
+            else:
+                first, steps = binary_chain(item)
+                for token, right in reversed(steps):
+                    work.append((APPLY_BINARY, binary_operation(token)))
+                    work.append(right)
+                work.append(first)
+
+        def evaluate():
+            stack = []
+            for kind, argument in program:
+                if kind == PUSH:
+                    stack.append(argument())
+                elif kind == APPLY_UNARY:
+                    stack[-1] = argument(stack[-1])
+                else:
+                    right = stack.pop()
+                    stack[-1] = argument(stack[-1], right)
+            return stack[0]
+        return evaluate
+
+def is_number(value) -> bool:
+    return type(value) is int or type(value) is float
+
+def count_nodes(expr) -> int:
+    count = 0
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        count += 1
+        if type(node) is Binary:
+            stack += (node.left, node.right)
+        elif type(node) is Unary:
+            stack.append(node.right)
+        elif type(node) is Grouping:
+            stack.append(node.expression)
+    return count
+
+# Folds literal-only subexpressions and drops groupings and double negations
+# that cannot change the result. Only rewrites that keep runtime behaviour,
+# errors included, are applied: mixed-type operands and division by zero
+# are left for evaluation to report.
+class ConstantFolder:
+    def __init__(self):
+        self.eliminated = 0
+
+    def fold(self, expr):
+        before = count_nodes(expr)
+        results = []
+        stack = [(expr, False)]
+        while stack:
+            node, visited = stack.pop()
+            kind = type(node)
+            if not visited and kind in (Binary, Unary, Grouping):
+                stack.append((node, True))
+                if kind is Binary:
+                    stack += ((node.right, False), (node.left, False))
+                else:
+                    stack.append((node.right if kind is Unary else node.expression, False))
+            elif kind is Binary:
+                right = results.pop()
+                results.append(self.binary(node, results.pop(), right))
+            elif kind is Unary:
+                results.append(self.unary(node, results.pop()))
+            elif kind is Grouping:
+                results.append(self.grouping(node, results.pop()))
+            else:
+                results.append(node)
+
+        folded = results.pop()
+        while type(folded) is Grouping:
+            folded = folded.expression
+        self.eliminated += before - count_nodes(folded)
+        return folded
+
+    def grouping(self, node: Grouping, inner):
+        if type(inner) in (Literal, Grouping, Unary):
+            return inner
+        return node if inner is node.expression else Grouping(inner)
+
+    def unary(self, node: Unary, right):
+        kind = node.operator.type
+        if type(right) is Literal:
+            value = right.value
+            if kind == "BANG":
+                return Literal(not is_truthy(value))
+            if is_number(value):
+                return Literal(-float(value))
+        if type(right) is Unary and right.operator.type == kind:
+            # -(-x) and !!x, when x is already a number or a boolean
+            inner = right.right
+            if kind == "MINUS" and self.is_numeric(inner) or kind == "BANG" and self.is_boolean(inner):
+                return inner
+        return node if right is node.right else Unary(node.operator, right)
+
+    def binary(self, node: Binary, left, right):
+        if type(left) is Literal and type(right) is Literal:
+            a, b = left.value, right.value
+            kind = node.operator.type
+            if kind == "EQUAL_EQUAL" or kind == "BANG_EQUAL":
+                a = float(a) if type(a) is int else a
+                b = float(b) if type(b) is int else b
+                return Literal(is_equal(a, b) == (kind == "EQUAL_EQUAL"))
+            if kind == "PLUS" and type(a) is str and type(b) is str:
+                return Literal(a + b)
+            if is_number(a) and is_number(b) and not (kind == "SLASH" and b == 0):
+                operation = NUMERIC_OPERATIONS.get(kind, operator.add)
+                return Literal(operation(float(a), float(b)))
+        if left is node.left and right is node.right:
+            return node
+        return Binary(left, node.operator, right)
+
+    def is_numeric(self, expr) -> bool:
+        # Evaluates to a number or raises; never to any other value
+        if type(expr) is Literal:
+            return is_number(expr.value)
+        if type(expr) is Unary:
+            return expr.operator.type == "MINUS"
+        if type(expr) is Binary:
+            return expr.operator.type in ("MINUS", "STAR", "SLASH")
+        return type(expr) is Grouping and self.is_numeric(expr.expression)
+
+    def is_boolean(self, expr) -> bool:
+        if type(expr) is Literal:
+            return type(expr.value) is bool
+        if type(expr) is Unary:
+            return expr.operator.type == "BANG"
+        if type(expr) is Binary:
+            return expr.operator.type not in ("PLUS", "MINUS", "STAR", "SLASH")
+        return type(expr) is Grouping and self.is_boolean(expr.expression)
+
+# Part of every cache key; bump when scanner or parser output changes
+CACHE_VERSION = "scanner-2.parser-1"
+
+# Larger files are streamed by tokenize instead of read whole and cached
+CACHE_MAX_SOURCE = 16 * 1024 * 1024
+
+# Cache payloads. Token streams are stored as the TokenBuffer arrays and
+# decoded against the source whose hash keyed them. Expression trees are
+# stored in postfix order as (opcode, argument) pairs, where operators refer
+# to their token index and literals to a table of values.
+AST_LITERAL, AST_UNARY, AST_BINARY, AST_GROUPING, AST_MISSING, AST_END = range(6)
+
+def encode_tokens(buffer: TokenBuffer, errors):
+    return (
+        buffer.kinds.tobytes(),
+        buffer.starts.tobytes(),
+        buffer.ends.tobytes(),
+        buffer.lines.tobytes(),
+        [(error.position, error.line, error.message) for error in errors],
+    )
+
+def decode_tokens(source: str, payload):
+    kinds, starts, ends, lines, errors = payload
+    buffer = TokenBuffer(source)
+    buffer.kinds.frombytes(kinds)
+    buffer.starts.frombytes(starts)
+    buffer.ends.frombytes(ends)
+    buffer.lines.frombytes(lines)
+    return buffer, [ScanError(*error) for error in errors]
+
+def encode_ast(statements):
+    codes = array("q")
+    values = []
+    for statement in statements:
+        # Pre-order with the right child visited first, reversed, is postfix
+        nodes = []
+        stack = [statement]
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            if type(node) is Binary:
+                stack += (node.left, node.right)
+            elif type(node) is Unary:
+                stack.append(node.right)
+            elif type(node) is Grouping:
+                stack.append(node.expression)
+        for node in reversed(nodes):
+            if type(node) is Literal:
+                codes += array("q", (AST_LITERAL, len(values)))
+                values.append(node.value)
+            elif type(node) is Unary:
+                codes += array("q", (AST_UNARY, node.operator.index))
+            elif type(node) is Binary:
+                codes += array("q", (AST_BINARY, node.operator.index))
+            elif type(node) is Grouping:
+                codes += array("q", (AST_GROUPING, 0))
+            else:
+                codes += array("q", (AST_MISSING, 0))
+        codes += array("q", (AST_END, 0))
+    return codes.tobytes(), values
+
+def decode_ast(tokens: TokenBuffer, data: bytes, values):
+    codes = array("q")
+    codes.frombytes(data)
+    statements = []
+    stack = []
+    for i in range(0, len(codes), 2):
+        code, argument = codes[i], codes[i + 1]
+        if code == AST_LITERAL:
+            stack.append(Literal(values[argument]))
+        elif code == AST_UNARY:
+            stack.append(Unary(tokens[argument], stack.pop()))
+        elif code == AST_BINARY:
+            right = stack.pop()
+            stack.append(Binary(stack.pop(), tokens[argument], right))
+        elif code == AST_GROUPING:
+            stack.append(Grouping(stack.pop()))
+        elif code == AST_MISSING:
+            stack.append(None)
+        else:
+            statements.append(stack.pop())
+    return statements
+
+def load_tokens(source: str, options, cache=None, stats=None):
+    stats = stats or NO_STATS
+    with stats.phase("scan"):
+        payload = cache.get(source, "tokens") if cache else None
+        if payload is not None:
+            return decode_tokens(source, payload)
+        scanner = ENGINES[options["engine"]](source)
+        if isinstance(scanner, RegexScanner):
+            tokens, errors = scanner.scan_buffer()
+        else:
+            tokens, errors = scanner.scan_tokens()
+    if cache:
+        cache.put(source, "tokens", encode_tokens(tokens, errors))
+    return tokens, errors
+
+def load_ast(source: str, options, cache=None, stats=None):
+    stats = stats or NO_STATS
+    with stats.phase("cache"):
+        payload = cache.get(source, "ast") if cache else None
+        if payload is not None:
+            token_payload, codes, values, parse_errors = payload
+            tokens, errors = decode_tokens(source, token_payload)
+            for error in parse_errors:
+                # Replayed in the order the parser reported them
+                print(error)
+            return tokens, errors, decode_ast(tokens, codes, values), parse_errors
+
+    tokens, errors = load_tokens(source, options, stats=stats)
+    with stats.phase("parse"):
+        parser = PARSERS[options["parser"]](tokens)
+        ast = parser.parse()
+    if cache:
+        codes, values = encode_ast(ast)
+        cache.put(source, "ast", (encode_tokens(tokens, errors), codes, values, parser.errors))
+    return tokens, errors, ast, parser.errors
+
+# Token output for tokenize. Lines are built in batches and written as one
+# encoded block each, instead of one print() per token.
+#
+# text   "TYPE lexeme literal", as Token.__str__
+# jsonl  {"type", "lexeme", "literal", "line"} per line
+# binary BINARY_MAGIC, the number of token types and each type name (one
+#        length byte and ASCII), then per token: type id (u8), line (u32),
+#        lexeme length (u32) and the UTF-8 lexeme, all little-endian
+FORMATS = ("text", "jsonl", "binary")
+BINARY_MAGIC = b"LOXTOK\x01"
+BINARY_RECORD = struct.Struct("<BII")
+WRITE_BATCH = 8192
+
+class TokenWriter:
+    def __init__(self, format: str = "text", stream=None):
+        stream = stream or sys.stdout
+        stream.flush()
+        self.format = format
+        self.stream = stream
+        self.raw = getattr(stream, "buffer", None)
+        self.encoding = getattr(stream, "encoding", None) or "utf-8"
+        self.errors = getattr(stream, "errors", None) or "strict"
+        self.numbers = {}
+        if format == "binary":
+            if self.raw is None:
+                raise ValueError("binary output needs a byte stream")
+            header = bytearray(BINARY_MAGIC)
+            header.append(len(TOKEN_TYPES))
+            for name in TOKEN_TYPES:
+                header.append(len(name))
+                header += name.encode("ascii")
+            self.raw.write(header)
+
+    def write(self, tokens):
+        # Accepts a TokenBuffer or any iterable of Token-like objects
+        if isinstance(tokens, TokenBuffer):
+            source = tokens.source
+            lexemes = [source[start:end] for start, end in zip(tokens.starts, tokens.ends)]
+            rows = zip(tokens.kinds, lexemes, tokens.lines)
+        else:
+            rows = ((TOKEN_TYPE_IDS[token.type], token.lexeme, token.line) for token in tokens)
+        rows = iter(rows)
+        while True:
+            batch = list(itertools.islice(rows, WRITE_BATCH))
+            if not batch:
+                break
+            if self.format == "binary":
+                self.raw.write(self.binary(batch))
+            elif self.format == "jsonl":
+                self.emit(self.jsonl(batch))
+            else:
+                self.emit(self.text(batch))
+
+    def emit(self, text: str):
+        if self.raw is None:
+            self.stream.write(text)
+        else:
+            self.raw.write(text.encode(self.encoding, self.errors))
+
+    def close(self):
+        (self.stream if self.raw is None else self.raw).flush()
+
+    def number_text(self, lexeme: str) -> str:
+        text = self.numbers.get(lexeme)
+        if text is None:
+            number = float(lexeme)
+            text = self.numbers[lexeme] = f"{number:.1f}" if number.is_integer() else str(number)
+        return text
+
+    def text(self, batch) -> str:
+        names = TOKEN_TYPES
+        lines = []
+        append = lines.append
+        for kind, lexeme, _ in batch:
+            if kind == NUMBER_ID:
+                append(f"{names[kind]} {lexeme} {self.number_text(lexeme)}\n")
+            elif kind == STRING_ID:
+                append(f"{names[kind]} {lexeme} {lexeme[1:-1]}\n")
+            else:
+                append(f"{names[kind]} {lexeme} null\n")
+        return "".join(lines)
+
+    def jsonl(self, batch) -> str:
+        names = TOKEN_TYPES
+        dumps = json.dumps
+        lines = []
+        for kind, lexeme, line in batch:
+            literal = make_literal(names[kind], lexeme)
+            lines.append(dumps({"type": names[kind], "lexeme": lexeme, "literal": literal, "line": line}) + "\n")
+        return "".join(lines)
+
+    def binary(self, batch) -> bytes:
+        pack = BINARY_RECORD.pack
+        parts = []
+        for kind, lexeme, line in batch:
+            data = lexeme.encode("utf-8", "surrogatepass")
+            parts.append(pack(kind, line, len(data)))
+            parts.append(data)
+        return b"".join(parts)
+
+# Wall and CPU time per phase for --stats. Phases with the same name add up.
+class Stats:
+    def __init__(self):
+        self.phases = {}
+        self.source = ""
+        self.tokens = ()
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            totals = self.phases.setdefault(name, [0.0, 0.0])
+            totals[0] += time.perf_counter() - wall
+            totals[1] += time.process_time() - cpu
+
+    def report(self, filename: str, cache, peak: int, format: str):
+        if isinstance(self.tokens, TokenBuffer):
+            counts = {TOKEN_TYPES[kind]: count for kind, count in Counter(self.tokens.kinds).items()}
+        else:
+            counts = Counter(token.type for token in self.tokens)
+        source = self.source
+        lines = source.count("\n") + (not source.endswith("\n") and bool(source))
+        result = {
+            "file": filename,
+            "phases": {name: {"wall": wall, "cpu": cpu} for name, (wall, cpu) in self.phases.items()},
+            "bytes": len(source.encode("utf-8", "surrogatepass")),
+            "lines": lines,
+            "tokens": len(self.tokens),
+            "token_types": dict(sorted(counts.items(), key=lambda item: -item[1])),
+            "peak_memory": peak,
+        }
+        if cache:
+            result["cache"] = {"hits": cache.hits, "misses": cache.misses, "evictions": cache.evictions}
+        if format == "json":
+            print(json.dumps(result), file=sys.stderr)
+            return
+        print(f"Stats for {filename}:", file=sys.stderr)
+        for name, times in result["phases"].items():
+            print(f"  {name:<10} wall {times['wall'] * 1000:9.2f} ms  cpu {times['cpu'] * 1000:9.2f} ms", file=sys.stderr)
+        print(f"  {result['bytes']} bytes, {lines} lines, {result['tokens']} tokens", file=sys.stderr)
+        print("  " + ", ".join(f"{name} {count}" for name, count in result["token_types"].items()), file=sys.stderr)
+        print(f"  peak memory {peak / 1024:.1f} KiB (tracemalloc, which also slows the phases above)", file=sys.stderr)
+        if cache:
+            print(f"  cache hits {cache.hits} misses {cache.misses} evictions {cache.evictions}", file=sys.stderr)
+
+# Stand-in when --stats is off: every phase is the same reusable no-op
+class NoStats:
+    PHASE = contextlib.nullcontext()
+
+    def phase(self, name: str):
+        return self.PHASE
+
+NO_STATS = NoStats()
+
+# Command-line options and their defaults
+OPTIONS = {
+    "engine": "regex",
+    "parser": "pratt",
+    "optimize": False,
+    "no-cache": False,
+    "jobs": "0",
+    "format": "text",
+    "stats": False,
+    "stats-format": "text",
+    "profile": "",
+    "columns": False,
+    "socket": "",
+}
+
+# Single-dash aliases for options
+SHORT_OPTIONS = {
+    "-j": "jobs",
+}
+
+def parse_args(args):
+    options = dict(OPTIONS)
+    positional = []
+    args = iter(args)
+    for arg in args:
+        if arg[:2] in SHORT_OPTIONS:
+            # -j 4 or -j4
+            arg = "--" + SHORT_OPTIONS[arg[:2]] + ("=" + arg[2:] if arg[2:] else "")
+        if not arg.startswith("--"):
+            positional.append(arg)
+            continue
+        name, has_value, value = arg[2:].partition("=")
+        if name not in options:
+            print(f"Unknown option: {arg}", file=sys.stderr)
+            exit(1)
+        if OPTIONS[name] is False:
+            # Boolean flags take no value
+            options[name] = True
+            continue
+        if not has_value:
+            value = next(args, None)
+            if value is None:
+                print(f"Missing value for option: {arg}", file=sys.stderr)
+                exit(1)
+        options[name] = value
+    return positional, options
+
+# Expands directories (to the .lox files below them) and glob patterns
+def expand_paths(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(path, "**", "*.lox"), recursive=True))
+        elif any(char in path for char in "*?["):
+            files += sorted(glob.glob(path, recursive=True))
+        else:
+            files.append(path)
+    return files
+
 # Main function
-def main():
-    if len(sys.argv) < 3:
-        print("Usage: ./your_program.sh <command> <filename>", file=sys.stderr)
+def main(args=None):
+    positional, options = parse_args(sys.argv[1:] if args is None else args)
+    if positional[:1] == ["serve"]:
+        import server
+        server.serve(options["socket"] or server.SOCKET_PATH, run_request)
+        return
+
+    if len(positional) < 2:
+        print("Usage: ./your_program.sh <command> <filename>... [-j N] [--format text|jsonl|binary] [--engine classic|regex] [--parser recursive|pratt] [--optimize] [--no-cache] [--stats] [--stats-format text|json] [--profile FILE] [--columns]", file=sys.stderr)
+        print("       ./your_program.sh serve [--socket PATH]", file=sys.stderr)
         exit(1)
 
-    command = sys.argv[1]
-    filename = sys.argv[2]
+    command = positional[0]
+    filenames = expand_paths(positional[1:])
 
-    if command not in ["tokenize", "parse"]:
+    if command not in ["tokenize", "parse", "evaluate", "run"]:
         print(f"Unknown command: {command}", file=sys.stderr)
         exit(1)
 
-    with open(filename) as file:
-        file_contents = file.read()
+    if options["engine"] not in ENGINES:
+        print(f"Unknown engine: {options['engine']}", file=sys.stderr)
+        exit(1)
 
-    scanner = Scanner(file_contents)
-    tokens, errors = scanner.scan_tokens()
+    if options["parser"] not in PARSERS:
+        print(f"Unknown parser: {options['parser']}", file=sys.stderr)
+        exit(1)
 
-    if command == "tokenize":
-        for token in tokens:
-            print(token)
+    if not options["jobs"].isdigit():
+        print(f"Invalid job count: {options['jobs']}", file=sys.stderr)
+        exit(1)
+
+    if options["format"] not in FORMATS:
+        print(f"Unknown format: {options['format']}", file=sys.stderr)
+        exit(1)
+
+    if options["stats-format"] not in ("text", "json"):
+        print(f"Unknown stats format: {options['stats-format']}", file=sys.stderr)
+        exit(1)
+
+    if not filenames:
+        print("No input files", file=sys.stderr)
+        exit(1)
+
+    if options["profile"] and len(filenames) > 1:
+        print("--profile takes a single input file", file=sys.stderr)
+        exit(1)
+
+    if options["format"] == "binary" and len(filenames) > 1:
+        print("--format binary takes a single input file", file=sys.stderr)
+        exit(1)
+
+    if len(positional) == 2 and len(filenames) == 1:
+        execute(command, filenames[0], options)
+    else:
+        exit(run_batch(command, filenames, options))
+
+# Runs several files, in worker processes when more than one job is allowed.
+# Each file's output is captured and written in input order, followed by its
+# exit status on stderr. Returns the highest per-file status.
+def run_batch(command: str, filenames, options) -> int:
+    jobs = int(options["jobs"]) or os.cpu_count() or 1
+    jobs = min(jobs, len(filenames))
+    if jobs == 1:
+        results = (execute_captured(command, filename, options) for filename in filenames)
+        return write_results(filenames, results)
+    # Only imported here: it pulls in multiprocessing, which single-file
+    # runs and the modules importing main.py don't need
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        results = executor.map(
+            execute_captured,
+            [command] * len(filenames),
+            filenames,
+            [options] * len(filenames),
+            chunksize=max(1, len(filenames) // (jobs * 8)),
+        )
+        return write_results(filenames, results)
+
+def write_results(filenames, results) -> int:
+    worst = 0
+    for filename, (out, err, status) in zip(filenames, results):
+        sys.stdout.write(f"==> {filename} <==\n")
+        sys.stdout.write(out)
+        sys.stdout.flush()
+        sys.stderr.write(err)
+        sys.stderr.write(f"{filename}: exit {status}\n")
+        worst = max(worst, status)
+    return worst
+
+def execute_captured(command: str, filename: str, options):
+    out, err = io.StringIO(), io.StringIO()
+    status = 0
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        try:
+            execute(command, filename, options)
+        except SystemExit as error:
+            status = error.code or 0
+        except OSError as error:
+            print(f"Cannot read {filename}: {error.strerror}", file=sys.stderr)
+            status = 1
+        except UnicodeDecodeError as error:
+            print(f"Cannot read {filename}: not valid {error.encoding} ({error.reason})", file=sys.stderr)
+            status = 1
+        except Exception:
+            # Reported like an uncaught exception in a single-file run, but
+            # the rest of the batch still runs
+            import traceback
+            traceback.print_exc()
+            status = 1
+    return out.getvalue(), err.getvalue(), status
+
+# Runs one command line for the server as main() would, in its working
+# directory and with source as stdin. Returns stdout and stderr as bytes
+# and the exit status.
+def run_request(args, cwd=None, source=None):
+    out = io.TextIOWrapper(io.BytesIO(), encoding="utf-8", write_through=True)
+    err = io.TextIOWrapper(io.BytesIO(), encoding="utf-8", write_through=True)
+    stdin = sys.stdin
+    directory = os.getcwd()
+    status = 0
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        try:
+            if cwd:
+                os.chdir(cwd)
+            sys.stdin = io.StringIO(source or "")
+            main(args)
+        except SystemExit as error:
+            status = error.code or 0
+        except Exception:
+            # Answers the way an uncaught exception ends a cold run, and
+            # the server keeps going
+            import traceback
+            traceback.print_exc()
+            status = 1
+        finally:
+            sys.stdin = stdin
+            os.chdir(directory)
+    return out.buffer.getvalue(), err.buffer.getvalue(), status
+
+def execute(command: str, filename: str, options):
+    # Token streams are only cached from the regex engine's TokenBuffer
+    cache = None
+    if options["engine"] == "regex" and not options["no-cache"]:
+        cache = Cache(version=CACHE_VERSION)
+    stats = NO_STATS
+    if options["stats"]:
+        import tracemalloc
+        stats = Stats()
+        tracemalloc.start()
+    profiler = None
+    if options["profile"]:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        run_command(command, filename, options, cache, stats)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(options["profile"])
+        if stats is not NO_STATS:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            stats.report(filename, cache, peak, options["stats-format"])
+        if cache:
+            cache.save_stats()
+
+def print_errors(errors, source: str, options):
+    if options["columns"] and errors:
+        index = LineIndex(source)
+        for error in errors:
+            print(error.format(index), file=sys.stderr)
+    else:
         for error in errors:
             print(error, file=sys.stderr)
+
+def open_source(filename: str):
+    # "-" reads the source from stdin, which is left open
+    if filename == "-":
+        return contextlib.nullcontext(sys.stdin)
+    return open(filename)
+
+def run_command(command: str, filename: str, options, cache, stats=NO_STATS):
+    with stats.phase("read"), open_source(filename) as file:
+        # Columns are looked up in a LineIndex of the whole source
+        if command == "tokenize" and options["engine"] == "regex" and not (options["stats"] or options["columns"]) and (
+            cache is None or filename == "-" or os.fstat(file.fileno()).st_size > CACHE_MAX_SOURCE
+        ):
+            # Stream tokens straight from the file instead of reading it whole
+            scanner = RegexScanner("")
+            writer = TokenWriter(options["format"])
+            for buffer in scanner.iter_buffers(file):
+                writer.write(buffer)
+            writer.close()
+            for error in scanner.errors:
+                print(error, file=sys.stderr)
+            if scanner.errors:
+                exit(65)
+            return
+        source = file.read()
+    stats.source = source
+
+    if command in ("tokenize", "run"):
+        tokens, errors = load_tokens(source, options, cache, stats)
+    else:
+        tokens, errors, ast, parse_errors = load_ast(source, options, cache, stats)
+        if options["optimize"] and not parse_errors:
+            with stats.phase("fold"):
+                folder = ConstantFolder()
+                ast = [folder.fold(node) for node in ast]
+            print(f"Optimized: eliminated {folder.eliminated} nodes", file=sys.stderr)
+    stats.tokens = tokens
+
+    if command == "tokenize":
+        with stats.phase("print"):
+            writer = TokenWriter(options["format"])
+            writer.write(tokens)
+            writer.close()
+            print_errors(errors, source, options)
     elif command == "parse":
-        parser = Parser(tokens)
-        ast = parser.parse()
-        for node in ast:
-            print(node)
+        with stats.phase("print"):
+            printer = AstPrinter()
+            for node in ast:
+                print(printer.print(node))
+    elif command == "evaluate":
+        print_errors(errors, source, options)
+        if errors or parse_errors:
+            exit(65)
+        compiler = ClosureCompiler()
+        try:
+            with stats.phase("evaluate"):
+                for node in ast:
+                    print(stringify(compiler.compile(node)()))
+        except LoxRuntimeError as error:
+            print(f"{error.message}\n[line {error.line}]", file=sys.stderr)
+            exit(70)
+    elif command == "run":
+        print_errors(errors, source, options)
+        if errors:
+            exit(65)
+        import vm
+        with stats.phase("run"):
+            status = vm.run(tokens)
+        if status:
+            exit(status)
 
     if errors:
         exit(65)  # Indicate failure
@@ -1,26 +1,96 @@
 import sys
 import os
 import time
-import mysql.connector
+import atexit
+import itertools
+import queue
+import threading
+from collections import Counter
 from datetime import datetime
-from termcolor import colored
-from dotenv import load_dotenv
 
-load_dotenv()
-
-def init_db():
-    conn = mysql.connector.connect(
-        host=os.getenv("DB_HOST"),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD"),
-        database=os.getenv("DB_NAME")
-    )
-    cursor = conn.cursor()
+# Modules only some paths need (dotenv, sqlite3 or mysql.connector,
+# hashlib, json for the spool, and the Visualizer with the interpreter
+# behind it) are imported where they are used, to keep startup short.
+
+# Settings may come from a .env file, looked up like python-dotenv's
+# find_dotenv(): in this file's directory, then its parents. dotenv is only
+# imported when there is a file to read.
+def load_env_file():
+    directory = os.path.dirname(os.path.abspath(__file__))
+    while True:
+        path = os.path.join(directory, ".env")
+        if os.path.isfile(path):
+            from dotenv import load_dotenv
+            load_dotenv(path)
+            return
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return
+        directory = parent
+
+load_env_file()
+
+# Storage backend: "mysql", or "sqlite" as a local stand-in stored at DB_PATH
+DB_BACKEND = os.getenv("DB_BACKEND", "mysql")
+DB_PATH = os.getenv("DB_PATH", "tokenizer_logs.db")
+# Token rows sent per executemany() call
+BATCH_SIZE = int(os.getenv("DB_BATCH_SIZE", "1000"))
+# Runs waiting for the background writer before submit() blocks
+QUEUE_SIZE = int(os.getenv("DB_QUEUE_SIZE", "16"))
+# Runs that could not be written are appended here and replayed later
+SPOOL_PATH = os.getenv("DB_SPOOL", "tokenizer_spool.jsonl")
+# Runs the database rejected are moved here, with the error, and not replayed
+DEAD_LETTER_PATH = os.getenv("DB_DEAD_LETTER", "tokenizer_dead_letter.jsonl")
+# Times a run is written before the database counts as unavailable
+WRITE_ATTEMPTS = int(os.getenv("DB_WRITE_ATTEMPTS", "2"))
+
+# init_db() records the schema version it brought each database to here,
+# and later runs skip the check. Delete it to force a check.
+SCHEMA_MARKER = os.getenv("DB_SCHEMA_MARKER", "tokenizer_schema.txt")
+
+# Rows shown per page by view_logs
+PAGE_SIZE = int(os.getenv("DB_PAGE_SIZE", "500"))
+
+# Token type ids stored in Tokens.token_type_id. Types not listed here are
+# added to TokenTypes with the next free id when first logged.
+TOKEN_TYPES = (
+    "EOF",
+    "LEFT_PAREN", "RIGHT_PAREN", "LEFT_BRACE", "RIGHT_BRACE",
+    "COMMA", "DOT", "MINUS", "PLUS", "SEMICOLON", "SLASH", "STAR",
+    "BANG", "BANG_EQUAL", "EQUAL", "EQUAL_EQUAL",
+    "GREATER", "GREATER_EQUAL", "LESS", "LESS_EQUAL",
+    "IDENTIFIER", "STRING", "NUMBER",
+    "AND", "CLASS", "ELSE", "FALSE", "FOR", "FUN", "IF", "NIL", "OR",
+    "PRINT", "RETURN", "SUPER", "THIS", "TRUE", "VAR", "WHILE",
+)
+
+# SQL that differs between the backends, substituted into the statements below
+DIALECTS = {
+    "mysql": {
+        "serial": "INT AUTO_INCREMENT PRIMARY KEY",
+        "small_serial": "SMALLINT AUTO_INCREMENT PRIMARY KEY",
+        "text_key": "VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin",
+        "exact_lexeme": "CONVERT(lexeme USING utf8mb4) COLLATE utf8mb4_bin",
+        "insert_ignore": "INSERT IGNORE",
+        "create_view": "CREATE OR REPLACE VIEW",
+    },
+    "sqlite": {
+        "serial": "INTEGER PRIMARY KEY AUTOINCREMENT",
+        "small_serial": "INTEGER PRIMARY KEY",
+        "text_key": "TEXT",
+        "exact_lexeme": "lexeme",
+        "insert_ignore": "INSERT OR IGNORE",
+        "create_view": "CREATE VIEW IF NOT EXISTS",
+    },
+}
 
-    # Create tables if they don't exist
-    cursor.execute('''
+# Version 1: the original schema, with types, lexemes and literals stored
+# verbatim on every token row. Existing databases from before SchemaVersion
+# are at this version; the statements leave their tables as they are.
+SCHEMA_V1 = [
+    '''
         CREATE TABLE IF NOT EXISTS TokenizerLog (
-            id INT AUTO_INCREMENT PRIMARY KEY,
+            id {serial},
             name VARCHAR(255),
             timestamp DATETIME,
             length_of_code INT,
@@ -29,11 +99,10 @@ def init_db():
             lines_processed INT,
             error_message TEXT
         )
-    ''')
-
-    cursor.execute('''
+    ''',
+    '''
         CREATE TABLE IF NOT EXISTS Tokens (
-            id INT AUTO_INCREMENT PRIMARY KEY,
+            id {serial},
             tokenizer_log_id INT,
             token_type VARCHAR(50),
             lexeme VARCHAR(255),
@@ -41,11 +110,10 @@ def init_db():
             line INT,
             FOREIGN KEY (tokenizer_log_id) REFERENCES TokenizerLog(id)
         )
-    ''')
-
+    ''',
     # Create view for TokenizerLog
-    cursor.execute('''
-        CREATE OR REPLACE VIEW TokenizerLogView AS
+    '''
+        {create_view} TokenizerLogView AS
         SELECT
             id AS LogID,
             name AS FileName,
@@ -56,43 +124,504 @@ def init_db():
             lines_processed AS LinesProcessed,
             error_message AS ErrorMessage
         FROM TokenizerLog
-    ''')
+    ''',
+]
+
+# Version 2: small-int type ids, interned lexemes, NULL for no literal and
+# an index for reading a run's tokens in line order. Tokens is rebuilt as
+# TokensV2 and renamed, keeping the row ids.
+SCHEMA_V2 = [
+    '''
+        CREATE TABLE TokenTypes (
+            id {small_serial},
+            name VARCHAR(50) NOT NULL UNIQUE
+        )
+    ''',
+    '''
+        CREATE TABLE Lexemes (
+            id {serial},
+            text {text_key} NOT NULL UNIQUE
+        )
+    ''',
+    '''
+        CREATE TABLE TokensV2 (
+            id {serial},
+            tokenizer_log_id INT NOT NULL,
+            token_type_id SMALLINT NOT NULL,
+            lexeme_id INT NOT NULL,
+            literal TEXT NULL,
+            line INT NOT NULL,
+            FOREIGN KEY (tokenizer_log_id) REFERENCES TokenizerLog(id),
+            FOREIGN KEY (token_type_id) REFERENCES TokenTypes(id),
+            FOREIGN KEY (lexeme_id) REFERENCES Lexemes(id)
+        )
+    ''',
+    "INSERT INTO TokenTypes (id, name) VALUES "
+    + ", ".join(f"({id}, '{name}')" for id, name in enumerate(TOKEN_TYPES, 1)),
+    '''
+        {insert_ignore} INTO TokenTypes (name)
+        SELECT DISTINCT token_type FROM Tokens WHERE token_type IS NOT NULL
+    ''',
+    '''
+        {insert_ignore} INTO Lexemes (text)
+        SELECT DISTINCT {exact_lexeme} FROM Tokens WHERE lexeme IS NOT NULL
+    ''',
+    '''
+        INSERT INTO TokensV2 (id, tokenizer_log_id, token_type_id, lexeme_id, literal, line)
+        SELECT Tokens.id, tokenizer_log_id, TokenTypes.id, Lexemes.id,
+            CASE WHEN literal = 'None' THEN NULL ELSE literal END, line
+        FROM Tokens
+        JOIN TokenTypes ON TokenTypes.name = token_type
+        JOIN Lexemes ON Lexemes.text = {exact_lexeme}
+    ''',
+    "DROP TABLE Tokens",
+    "ALTER TABLE TokensV2 RENAME TO Tokens",
+    "CREATE INDEX tokens_log_line ON Tokens (tokenizer_log_id, line)",
+    '''
+        {create_view} TokensView AS
+        SELECT t.id, t.tokenizer_log_id, y.name AS token_type, x.text AS lexeme, t.literal, t.line
+        FROM Tokens t
+        JOIN TokenTypes y ON y.id = t.token_type_id
+        JOIN Lexemes x ON x.id = t.lexeme_id
+    ''',
+]
+
+# Version 3: runs carry a hash of their source. A run whose hash matches an
+# earlier run points tokens_log_id at that run instead of storing its own
+# tokens; NULL means the run owns its tokens.
+SCHEMA_V3 = [
+    "ALTER TABLE TokenizerLog ADD COLUMN source_hash CHAR(64) NULL",
+    "ALTER TABLE TokenizerLog ADD COLUMN tokens_log_id INT NULL REFERENCES TokenizerLog(id)",
+    "CREATE INDEX tokenizer_log_hash ON TokenizerLog (source_hash)",
+    "DROP VIEW IF EXISTS TokenizerLogView",
+    '''
+        CREATE VIEW TokenizerLogView AS
+        SELECT
+            id AS LogID,
+            name AS FileName,
+            timestamp AS LoggedAt,
+            length_of_code AS CodeLength,
+            status AS Status,
+            total_tokens AS TotalTokens,
+            lines_processed AS LinesProcessed,
+            error_message AS ErrorMessage,
+            source_hash AS SourceHash,
+            COALESCE(tokens_log_id, id) AS TokensLogID
+        FROM TokenizerLog
+    ''',
+]
+
+# Version 4: per-run aggregates written with each run, so view --stats never
+# reads Tokens. Runs logged before it get token counts from a one-off pass
+# over Tokens. Their RunSummary fields cannot be recovered (the Scanner did
+# not count lines then, so their tokens all say line 1) and stay NULL.
+# max_line is the highest line holding a token, which unlike
+# lines_processed leaves out trailing blank and token-less lines.
+SCHEMA_V4 = [
+    '''
+        CREATE TABLE TokenTypeCounts (
+            tokenizer_log_id INT NOT NULL,
+            token_type_id SMALLINT NOT NULL,
+            count INT NOT NULL,
+            PRIMARY KEY (tokenizer_log_id, token_type_id),
+            FOREIGN KEY (tokenizer_log_id) REFERENCES TokenizerLog(id),
+            FOREIGN KEY (token_type_id) REFERENCES TokenTypes(id)
+        )
+    ''',
+    '''
+        CREATE TABLE RunSummary (
+            tokenizer_log_id INT NOT NULL PRIMARY KEY,
+            error_count INT NULL,
+            max_line INT NULL,
+            scan_seconds DOUBLE NULL,
+            bytes_per_second DOUBLE NULL,
+            FOREIGN KEY (tokenizer_log_id) REFERENCES TokenizerLog(id)
+        )
+    ''',
+    '''
+        INSERT INTO TokenTypeCounts (tokenizer_log_id, token_type_id, count)
+        SELECT TokenizerLog.id, token_type_id, COUNT(*)
+        FROM TokenizerLog
+        JOIN Tokens ON Tokens.tokenizer_log_id = COALESCE(TokenizerLog.tokens_log_id, TokenizerLog.id)
+        GROUP BY TokenizerLog.id, token_type_id
+    ''',
+]
+
+MIGRATIONS = [SCHEMA_V1, SCHEMA_V2, SCHEMA_V3, SCHEMA_V4]
+
+# Part of every source hash; bump it when Scanner output changes so that
+# new runs stop sharing tokens with runs from the old scanner
+SCANNER_VERSION = 2
+
+def hash_source(source):
+    import hashlib
+    digest = hashlib.sha256(f"scanner-{SCANNER_VERSION}:".encode())
+    digest.update(source.encode("utf-8", "surrogatepass"))
+    return digest.hexdigest()
+
+connection = None
+connection_pid = None
+
+# One connection per process, opened on first use and shared by every call.
+# A forked child opens its own rather than reusing the parent's socket.
+def get_connection():
+    global connection, connection_pid
+    if connection is not None and connection_pid == os.getpid():
+        return connection
+    if DB_BACKEND == "sqlite":
+        import sqlite3
+        # Used from the writer thread, but never from two threads at once
+        connection = sqlite3.connect(DB_PATH, check_same_thread=False)
+    else:
+        import mysql.connector
+        connection = mysql.connector.connect(
+            host=os.getenv("DB_HOST"),
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD"),
+            database=os.getenv("DB_NAME")
+        )
+    connection_pid = os.getpid()
+    return connection
+
+# The connection for one unit of work, such as logging a run. MySQL drops
+# idle connections, so it is checked here, once, and reopened if needed.
+# Never reconnect in the middle of a unit: the new session would not have
+# the rows its transaction had written so far.
+def begin():
+    conn = get_connection()
+    if DB_BACKEND == "mysql":
+        conn.ping(reconnect=True)
+    return conn
+
+# The DB-API module whose exception classes the backend raises
+def driver_errors():
+    if DB_BACKEND == "sqlite":
+        import sqlite3
+        return sqlite3
+    import mysql.connector
+    return mysql.connector.errors
+
+# Errors meaning the database is unreachable or the connection was lost
+def connection_errors():
+    errors = driver_errors()
+    return (errors.OperationalError, errors.InterfaceError)
+
+# Errors meaning the database refused the data itself: a value too long for
+# its column under strict mode, a broken constraint, a statement it rejects.
+# Writing the same run again fails the same way.
+def data_errors():
+    errors = driver_errors()
+    return (errors.DataError, errors.IntegrityError, errors.ProgrammingError)
+
+def close_connection():
+    global connection
+    if connection is not None and connection_pid == os.getpid():
+        connection.close()
+    connection = None
+
+# Queries are written with MySQL's %s placeholders; sqlite3 expects ?
+def query(sql):
+    return sql.replace("%s", "?") if DB_BACKEND == "sqlite" else sql
+
+# Ids already looked up or inserted. Cleared on rollback, since ids handed
+# out inside a rolled-back transaction may not exist.
+type_ids = {}
+lexeme_ids = {}
+LEXEME_CACHE_SIZE = 100000
+
+def reset_interned():
+    type_ids.clear()
+    lexeme_ids.clear()
+
+# Creates the schema or migrates it to the latest version. MySQL commits DDL
+# implicitly, so a migration interrupted there has to be finished by hand.
+def init_db():
+    if schema_is_current():
+        return
+    conn = get_connection()
+    cursor = conn.cursor()
+    dialect = DIALECTS[DB_BACKEND]
+
+    cursor.execute("CREATE TABLE IF NOT EXISTS SchemaVersion (version INT NOT NULL)")
+    cursor.execute("SELECT MAX(version) FROM SchemaVersion")
+    version = cursor.fetchone()[0] or 0
+    for number, statements in enumerate(MIGRATIONS[version:], version + 1):
+        for statement in statements:
+            cursor.execute(statement.format(**dialect))
+        cursor.execute("DELETE FROM SchemaVersion")
+        cursor.execute(query("INSERT INTO SchemaVersion (version) VALUES (%s)"), (number,))
+        conn.commit()
 
     conn.commit()
-    conn.close()
-
-def log_tokenizer_entry(name, length_of_code, status, total_tokens=0, lines_processed=0, error_message=None):
-    conn = mysql.connector.connect(
-        host=os.getenv("DB_HOST"),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD"),
-        database=os.getenv("DB_NAME")
-    )
+    cursor.close()
+    record_schema()
+
+# Identifies the database in SCHEMA_MARKER
+def database_key():
+    if DB_BACKEND == "sqlite":
+        return f"sqlite:{os.path.abspath(DB_PATH)}"
+    return f"mysql:{os.getenv('DB_USER')}@{os.getenv('DB_HOST')}/{os.getenv('DB_NAME')}"
+
+# One "version key" line per database
+def read_schema_marker():
+    marker = {}
+    try:
+        with open(SCHEMA_MARKER) as file:
+            for line in file:
+                version, _, key = line.rstrip("\n").partition(" ")
+                if version.isdigit():
+                    marker[key] = int(version)
+    except OSError:
+        pass
+    return marker
+
+def schema_is_current():
+    # A deleted SQLite file starts from scratch whatever the marker says
+    if DB_BACKEND == "sqlite" and not os.path.exists(DB_PATH):
+        return False
+    return read_schema_marker().get(database_key()) == len(MIGRATIONS)
+
+def record_schema():
+    marker = read_schema_marker()
+    marker[database_key()] = len(MIGRATIONS)
+    temporary = f"{SCHEMA_MARKER}.{os.getpid()}.tmp"
+    try:
+        with open(temporary, "w") as file:
+            file.writelines(f"{version} {key}\n" for key, version in marker.items())
+        os.replace(temporary, SCHEMA_MARKER)
+    except OSError:
+        pass
+
+def log_tokenizer_entry(conn, name, length_of_code, status, total_tokens=0, lines_processed=0, error_message=None, timestamp=None, source_hash=None, tokens_log_id=None, commit=True):
     cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO TokenizerLog (name, timestamp, length_of_code, status, total_tokens, lines_processed, error_message)
-        VALUES (%s, %s, %s, %s, %s, %s, %s)
-    ''', (name, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), length_of_code, status, total_tokens, lines_processed, error_message))
+    cursor.execute(query('''
+        INSERT INTO TokenizerLog (name, timestamp, length_of_code, status, total_tokens, lines_processed, error_message, source_hash, tokens_log_id)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    '''), (name, timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S"), length_of_code, status, total_tokens, lines_processed, error_message, source_hash, tokens_log_id))
     log_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    if commit:
+        conn.commit()
+    cursor.close()
     return log_id
 
-def log_tokens(log_id, tokens):
-    conn = mysql.connector.connect(
-        host=os.getenv("DB_HOST"),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD"),
-        database=os.getenv("DB_NAME")
-    )
+# Records a run and its tokens in one transaction on conn. If an earlier run
+# had the same source hash, the new entry references its tokens and none are
+# written.
+def log_run(conn, rows, source_hash=None, summary=None, **entry):
+    owner = find_tokens(conn, source_hash) if source_hash else None
+    log_id = log_tokenizer_entry(conn, **entry, source_hash=source_hash, tokens_log_id=owner, commit=False)
+    if summary is not None:
+        log_summary(conn, log_id, summary)
+    if owner is None:
+        log_token_rows(conn, log_id, rows)
+    else:
+        conn.commit()
+    return log_id
+
+# Stores the aggregates from Scanner.summary() for a run, uncommitted
+def log_summary(conn, log_id, summary):
     cursor = conn.cursor()
-    for token in tokens:
-        cursor.execute('''
-            INSERT INTO Tokens (tokenizer_log_id, token_type, lexeme, literal, line)
+    try:
+        counts = summary["counts"]
+        intern(cursor, "TokenTypes", "name", type_ids, counts)
+        cursor.executemany(query(
+            "INSERT INTO TokenTypeCounts (tokenizer_log_id, token_type_id, count) VALUES (%s, %s, %s)"
+        ), [(log_id, type_ids[name], count) for name, count in counts.items()])
+        seconds = summary["scan_seconds"]
+        cursor.execute(query('''
+            INSERT INTO RunSummary (tokenizer_log_id, error_count, max_line, scan_seconds, bytes_per_second)
             VALUES (%s, %s, %s, %s, %s)
-        ''', (log_id, token.type, token.lexeme, str(token.literal), token.line))
-    conn.commit()
-    conn.close()
+        '''), (log_id, summary["error_count"], summary["max_line"], seconds, summary["bytes"] / seconds if seconds else None))
+    finally:
+        cursor.close()
+
+# Id of the run that owns the tokens for source_hash, or None
+def find_tokens(conn, source_hash):
+    cursor = conn.cursor()
+    cursor.execute(query(
+        "SELECT id FROM TokenizerLog WHERE source_hash = %s AND tokens_log_id IS NULL ORDER BY id LIMIT 1"
+    ), (source_hash,))
+    row = cursor.fetchone()
+    cursor.close()
+    return row[0] if row else None
+
+def token_rows(tokens):
+    return [
+        (token.type, token.lexeme, None if token.literal is None else str(token.literal), token.line)
+        for token in tokens
+    ]
+
+def log_tokens(conn, log_id, tokens, batch_size=BATCH_SIZE):
+    log_token_rows(conn, log_id, token_rows(tokens), batch_size)
+
+# Inserts (type, lexeme, literal, line) rows batch_size at a time with
+# executemany(), which the MySQL driver turns into multi-row INSERTs. The
+# transaction, including an uncommitted log entry, commits once at the end.
+def log_token_rows(conn, log_id, rows, batch_size=BATCH_SIZE):
+    cursor = conn.cursor()
+    sql = query('''
+        INSERT INTO Tokens (tokenizer_log_id, token_type_id, lexeme_id, literal, line)
+        VALUES (%s, %s, %s, %s, %s)
+    ''')
+    rows = iter(rows)
+    try:
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+            intern(cursor, "TokenTypes", "name", type_ids, {row[0] for row in batch})
+            intern(cursor, "Lexemes", "text", lexeme_ids, {row[1] for row in batch})
+            cursor.executemany(sql, [
+                (log_id, type_ids[type], lexeme_ids[lexeme], literal, line)
+                for type, lexeme, literal, line in batch
+            ])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        reset_interned()
+        raise
+    finally:
+        cursor.close()
+
+# Makes sure every value has a row in table and its id in ids
+def intern(cursor, table, column, ids, values):
+    if len(ids) > LEXEME_CACHE_SIZE:
+        ids.clear()
+    missing = [value for value in values if value not in ids]
+    if not missing:
+        return
+    insert_ignore = DIALECTS[DB_BACKEND]["insert_ignore"]
+    cursor.executemany(query(f"{insert_ignore} INTO {table} ({column}) VALUES (%s)"), [(value,) for value in missing])
+    for start in range(0, len(missing), 500):
+        chunk = missing[start:start + 500]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        cursor.execute(query(f"SELECT id, {column} FROM {table} WHERE {column} IN ({placeholders})"), chunk)
+        for id, value in cursor.fetchall():
+            ids[value] = id
+
+# Writes runs on a background thread so a slow or unreachable database never
+# holds up tokenizing. submit() blocks only while the queue is full. Runs
+# that fail to write are spooled to SPOOL_PATH, one JSON object per line,
+# and replayed by the next writer to start. A run whose connection drops part
+# way through is rolled back and written again, up to WRITE_ATTEMPTS times.
+# A run the database rejects for its data goes to DEAD_LETTER_PATH instead,
+# so one bad run neither loops through the spool nor takes the writer offline.
+class LogWriter(threading.Thread):
+    def __init__(self, maxsize=QUEUE_SIZE):
+        super().__init__(name="db-writer", daemon=True)
+        self.queue = queue.Queue(maxsize)
+        self.ready = False
+        self.offline = False
+        self.closed = False
+        self.start()
+        atexit.register(self.close)
+
+    def submit(self, name, length_of_code, status, tokens, total_tokens=0, lines_processed=0, error_message=None, source=None, summary=None):
+        entry = {
+            "name": name,
+            "length_of_code": length_of_code,
+            "status": status,
+            "total_tokens": total_tokens,
+            "lines_processed": lines_processed,
+            "error_message": error_message,
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "source_hash": None if source is None else hash_source(source),
+            "summary": summary,
+        }
+        self.queue.put((entry, token_rows(tokens)))
+
+    # Waits for queued runs to be written or spooled
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.join()
+
+    def run(self):
+        self.replay()
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            self.write(job)
+
+    def write(self, job):
+        if not self.offline:
+            try:
+                self.write_run(job)
+                return
+            except Exception as error:
+                # Could not connect or migrate, or lost the connection on
+                # every attempt. Stop trying for the rest of this run; the
+                # spool is replayed next time.
+                self.offline = True
+                self.rollback()
+                print(f"Database unavailable ({error}); spooling logs to {SPOOL_PATH}", file=sys.stderr)
+        self.spool(job)
+
+    def write_run(self, job):
+        entry, rows = job
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            if not self.ready:
+                init_db()
+                self.ready = True
+            conn = begin()
+            try:
+                log_run(conn, rows, **entry)
+                return
+            except connection_errors():
+                self.rollback()
+                if attempt == WRITE_ATTEMPTS:
+                    raise
+            except data_errors() as error:
+                self.rollback()
+                self.dead_letter(job, error)
+                return
+
+    def rollback(self):
+        reset_interned()
+        try:
+            if connection is not None:
+                connection.rollback()
+        except Exception:
+            pass
+
+    def spool(self, job):
+        entry, rows = job
+        append_record(SPOOL_PATH, {"entry": entry, "tokens": rows})
+
+    def dead_letter(self, job, error):
+        entry, rows = job
+        print(f"Database rejected the log of {entry['name']} ({error}); moved it to {DEAD_LETTER_PATH}", file=sys.stderr)
+        append_record(DEAD_LETTER_PATH, {"entry": entry, "tokens": rows, "error": str(error)})
+
+    def replay(self):
+        # The spool is renamed first so runs spooled again during the replay
+        # start a new file. A replay that was cut short is picked up again.
+        pending = SPOOL_PATH + ".replay"
+        if not os.path.exists(pending):
+            if not os.path.exists(SPOOL_PATH):
+                return
+            os.replace(SPOOL_PATH, pending)
+        import json
+        with open(pending) as file:
+            for line in file:
+                try:
+                    job = json.loads(line)
+                except ValueError:
+                    # A line cut off by a crash while spooling
+                    continue
+                self.write((job["entry"], job["tokens"]))
+        os.remove(pending)
+
+# Appends one JSON line and makes sure it reached the disk
+def append_record(path, record):
+    import json
+    with open(path, "a") as file:
+        file.write(json.dumps(record) + "\n")
+        file.flush()
+        os.fsync(file.fileno())
 
 KEYWORDS = {
     "and": "AND", "class": "CLASS", "else": "ELSE", "false": "FALSE",
@@ -102,11 +631,12 @@ KEYWORDS = {
 }
 
 class Token:
-    def __init__(self, type: str, lexeme: str, literal, line: int):
+    def __init__(self, type: str, lexeme: str, literal, line: int, start=None):
         self.type = type
         self.lexeme = lexeme
         self.literal = literal
         self.line = line
+        self.start = start
 
     def __str__(self):
         literal_str = "null" if self.literal is None else str(self.literal)
@@ -119,14 +649,28 @@ class Scanner:
         self.start = 0
         self.current = 0
         self.line = 1
+        # Aggregates for the run summary, kept up to date while scanning
+        self.type_counts = Counter()
+        self.error_count = 0
 
     def scan_tokens(self):
         while not self.is_at_end():
             self.start = self.current
             self.scan_token()
-        self.tokens.append(Token("EOF", "", None, self.line))
+        self.tokens.append(Token("EOF", "", None, self.line, len(self.source)))
+        self.type_counts["EOF"] += 1
         return self.tokens
 
+    def summary(self, scan_seconds):
+        return {
+            "counts": dict(self.type_counts),
+            "error_count": self.error_count,
+            # Line of the last token before EOF; None when there is none
+            "max_line": self.tokens[-2].line if len(self.tokens) > 1 else None,
+            "scan_seconds": scan_seconds,
+            "bytes": len(self.source.encode("utf-8", "surrogatepass")),
+        }
+
     def is_at_end(self):
         return self.current >= len(self.source)
 
@@ -148,6 +692,11 @@ class Scanner:
             self.handle_number()
         elif char.isalpha() or char == "_":
             self.handle_identifier()
+        elif char == "\n":
+            self.line += 1
+        elif not char.isspace():
+            # Characters the scanner has no token for are skipped
+            self.error_count += 1
 
     def advance(self):
         self.current += 1
@@ -171,62 +720,86 @@ class Scanner:
 
     def add_token(self, type: str, literal=None):
         text = self.source[self.start:self.current]
-        self.tokens.append(Token(type, text, literal, self.line))
+        self.tokens.append(Token(type, text, literal, self.line, self.start))
+        self.type_counts[type] += 1
 
-class Visualizer:
-    def __init__(self, source, tokens):
-        self.source = source
-        self.tokens = tokens
-
-    def display_tokens(self):
-        for idx, token in enumerate(self.tokens):
-            os.system("clear" if os.name == "posix" else "cls")
-            highlighted_code = self.highlight_token(idx)
-            print("Input Code:\n" + highlighted_code)
-            print(f"\nTokens Processed:")
-            for processed_token in self.tokens[:idx + 1]:
-                print(processed_token)
-            time.sleep(2)
-
-    def highlight_token(self, current_idx):
-        result = []
-        for idx, token in enumerate(self.tokens):
-            token_text = token.lexeme
-            if idx == current_idx:
-                result.append(colored(token_text, "red", attrs=["bold"]))
-            else:
-                result.append(token_text)
-        return self.source.replace(self.tokens[current_idx].lexeme, result[current_idx], 1)
-
-def view_logs():
-    conn = mysql.connector.connect(
-        host=os.getenv("DB_HOST"),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD"),
-        database=os.getenv("DB_NAME")
-    )
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM TokenizerLogView")
-    rows = cursor.fetchall()
-    col_names = [desc[0] for desc in cursor.description]
+def view_logs(page_size=PAGE_SIZE):
+    cursor = get_connection().cursor()
     print("Tokenizer Logs:\n")
-    print(" | ".join(col_names))
-    print("-" * 80)
-    for row in rows:
-        print(" | ".join(str(cell) if cell is not None else "NULL" for cell in row))
-    conn.close()
+    print_pages(cursor, "SELECT * FROM TokenizerLogView WHERE LogID > %s ORDER BY LogID LIMIT %s", page_size)
+    cursor.close()
 
-def main():
-    init_db()
+# Answers from TokenTypeCounts and RunSummary only, never from Tokens
+def view_stats(page_size=PAGE_SIZE):
+    cursor = get_connection().cursor()
 
+    print("Token types over all runs:\n")
+    cursor.execute('''
+        SELECT TokenTypes.name, SUM(count) FROM TokenTypeCounts
+        JOIN TokenTypes ON TokenTypes.id = token_type_id
+        GROUP BY TokenTypes.name ORDER BY SUM(count) DESC
+    ''')
+    for name, count in cursor:
+        print(f"{name:<15} {count}")
+
+    print("\nToken types by day:\n")
+    cursor.execute('''
+        SELECT DATE(timestamp), TokenTypes.name, SUM(count) FROM TokenTypeCounts
+        JOIN TokenizerLog ON TokenizerLog.id = tokenizer_log_id
+        JOIN TokenTypes ON TokenTypes.id = token_type_id
+        GROUP BY DATE(timestamp), TokenTypes.name ORDER BY DATE(timestamp), SUM(count) DESC
+    ''')
+    for day, group in itertools.groupby(cursor, key=lambda row: row[0]):
+        print(f"{day} | " + ", ".join(f"{name} {count}" for _, name, count in group))
+
+    print("\nRuns:\n")
+    print_pages(cursor, '''
+        SELECT TokenizerLog.id AS LogID, name AS FileName, total_tokens AS TotalTokens,
+            COALESCE(TokenTypeCounts.count, 0) AS Identifiers, error_count AS Errors,
+            max_line AS MaxLine, bytes_per_second AS BytesPerSecond
+        FROM TokenizerLog
+        LEFT JOIN RunSummary ON RunSummary.tokenizer_log_id = TokenizerLog.id
+        LEFT JOIN TokenTypeCounts ON TokenTypeCounts.tokenizer_log_id = TokenizerLog.id
+            AND TokenTypeCounts.token_type_id = (SELECT id FROM TokenTypes WHERE name = 'IDENTIFIER')
+        WHERE TokenizerLog.id > %s ORDER BY TokenizerLog.id LIMIT %s
+    ''', page_size)
+    cursor.close()
+
+# Pages through a query by id instead of fetching every row at once. The
+# query takes the last id seen and the page size; rows of a page are read
+# from the cursor as they arrive.
+def print_pages(cursor, sql, page_size):
+    sql = query(sql)
+    last_id = 0
+    first_page = True
+    while True:
+        cursor.execute(sql, (last_id, page_size))
+        if first_page:
+            first_page = False
+            col_names = [desc[0] for desc in cursor.description]
+            print(" | ".join(col_names))
+            print("-" * 80)
+        count = 0
+        for row in cursor:
+            print(" | ".join(str(cell) if cell is not None else "NULL" for cell in row))
+            last_id = row[0]
+            count += 1
+        if count < page_size:
+            break
+
+def main():
     if len(sys.argv) < 2:
-        print("Usage: python3 main.py <command> [<filename>]", file=sys.stderr)
+        print("Usage: python3 main.py <command> [<filename>] (commands: tokenize <filename>, view [--stats])", file=sys.stderr)
         exit(1)
 
     command = sys.argv[1]
 
     if command == "view":
-        view_logs()
+        init_db()
+        if "--stats" in sys.argv[2:]:
+            view_stats()
+        else:
+            view_logs()
     elif command == "tokenize":
         if len(sys.argv) < 3:
             print("Usage: python3 main.py tokenize <filename>", file=sys.stderr)
@@ -237,13 +810,18 @@ def main():
             file_contents = file.read()
 
         scanner = Scanner(file_contents)
+        start = time.perf_counter()
         tokens = scanner.scan_tokens()
+        summary = scanner.summary(time.perf_counter() - start)
 
-        log_id = log_tokenizer_entry(filename, len(file_contents), "SUCCESS", total_tokens=len(tokens), lines_processed=file_contents.count('\n') + 1)
-        log_tokens(log_id, tokens)
+        # Persisted in the background while the visualizer runs
+        writer = LogWriter()
+        writer.submit(filename, len(file_contents), "SUCCESS", tokens, total_tokens=len(tokens), lines_processed=file_contents.count('\n') + 1, source=file_contents, summary=summary)
 
+        from token_highighting import Visualizer
         visualizer = Visualizer(file_contents, tokens)
         visualizer.display_tokens()
+        writer.close()
     else:
         print("Unknown command. Try 'tokenize' or 'view'.")
 
@@ -0,0 +1,84 @@
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+
+# Persistent server for main.py. One warm process takes command lines on a
+# Unix socket and answers with the stdout, stderr and exit status a cold run
+# would give, so repeated calls skip interpreter startup and imports. This
+# module stays free of heavy imports so client.py can load it cheaply.
+#
+# Every message is a sequence of frames: a 4-byte big-endian length, then
+# the payload. A request is one JSON frame {"args", "cwd", "source"}, where
+# source is the text a "-" argument reads. The answer is a JSON frame
+# {"status"} followed by a stdout frame and a stderr frame. Requests are
+# served one at a time, since each one takes over the process's standard
+# streams and working directory.
+
+SOCKET_PATH = os.environ.get("LOX_SOCKET", ".loxserve.sock")
+FRAME_HEADER = struct.Struct(">I")
+
+def write_frame(connection, payload: bytes):
+    connection.sendall(FRAME_HEADER.pack(len(payload)) + payload)
+
+def read_frame(connection) -> bytes:
+    (size,) = FRAME_HEADER.unpack(read_exactly(connection, FRAME_HEADER.size))
+    return read_exactly(connection, size)
+
+def read_exactly(connection, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = connection.recv(min(size, 1 << 20))
+        if not chunk:
+            raise EOFError("connection closed inside a frame")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+def is_serving(path: str) -> bool:
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        return False
+    finally:
+        probe.close()
+    return True
+
+# Serves until interrupted or terminated. handler(args, cwd, source)
+# returns (stdout bytes, stderr bytes, status).
+def serve(path: str, handler):
+    # Requests change the working directory, so keep the socket's full path
+    path = os.path.abspath(path)
+    if is_serving(path):
+        print(f"Already serving on {path}", file=sys.stderr)
+        exit(1)
+    try:
+        # Left behind by a server that did not shut down cleanly
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(64)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    print(f"Serving on {path}", file=sys.stderr)
+    try:
+        while True:
+            connection, _ = listener.accept()
+            with connection:
+                try:
+                    request = json.loads(read_frame(connection))
+                    out, err, status = handler(request["args"], request.get("cwd"), request.get("source"))
+                    write_frame(connection, json.dumps({"status": status}).encode())
+                    write_frame(connection, out)
+                    write_frame(connection, err)
+                except (OSError, EOFError, ValueError, KeyError) as error:
+                    print(f"Bad request: {error!r}", file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+        os.remove(path)
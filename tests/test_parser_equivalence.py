@@ -0,0 +1,55 @@
+# PrattParser must build the same trees and report the same errors as the
+# recursive Parser, including its recovery after an error. Expressions are
+# random, from a fixed seed, so a failure reproduces.
+import contextlib
+import io
+import random
+
+import main as lox
+
+SEED = 0
+EXPRESSIONS = 2000
+
+OPERANDS = ["1", "2.5", '"s"']
+OPERATORS = ["+", "-", "*", "/", "==", "!=", "<", ">="]
+# Tokens that break an expression, to exercise error recovery
+NOISE = ["(", ")", ";", "x", "nil", "and", "}", "-", "!"]
+
+def random_expression(rng, depth: int = 0) -> str:
+    roll = rng.random()
+    if roll < 0.05:
+        return rng.choice(NOISE)
+    if depth > 6 or roll < 0.35:
+        return rng.choice(OPERANDS)
+    if roll < 0.5:
+        return rng.choice(["-", "!"]) + random_expression(rng, depth + 1)
+    if roll < 0.65:
+        return "(" + random_expression(rng, depth + 1) + ")"
+    left = random_expression(rng, depth + 1)
+    return left + " " + rng.choice(OPERATORS) + " " + random_expression(rng, depth + 1)
+
+def parsed(parser_class, source: str):
+    tokens, _ = lox.RegexScanner(source).scan_buffer()
+    parser = parser_class(tokens)
+    # Parse errors are printed as well as recorded
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        expressions = parser.parse()
+    printer = lox.AstPrinter()
+    trees = [None if expression is None else printer.print(expression) for expression in expressions]
+    return trees, parser.errors, output.getvalue(), parser.current
+
+def test_pratt_parser_matches_parser():
+    rng = random.Random(SEED)
+    for _ in range(EXPRESSIONS):
+        source = random_expression(rng)
+        assert parsed(lox.PrattParser, source) == parsed(lox.Parser, source), source
+
+def test_pratt_parser_handles_deep_nesting():
+    depth = 100000
+    trees, errors, _, _ = parsed(lox.PrattParser, "(" * depth + "1" + ")" * depth)
+    assert errors == []
+    assert trees == ["(group " * depth + "1.0" + ")" * depth]
+    trees, errors, _, _ = parsed(lox.PrattParser, "-" * depth + "1")
+    assert errors == []
+    assert trees == ["(- " * depth + "1.0" + ")" * depth]
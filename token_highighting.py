@@ -1,7 +1,10 @@
 import sys
-import os
+import json
+import shutil
 import time
-from termcolor import colored
+from bisect import bisect_left
+
+from main import LineIndex
 
 # Keywords mapping
 KEYWORDS = {
@@ -25,11 +28,13 @@ KEYWORDS = {
 
 # Token class
 class Token:
-    def __init__(self, type: str, lexeme: str, literal, line: int):
+    def __init__(self, type: str, lexeme: str, literal, line: int, start=None):
         self.type = type
         self.lexeme = lexeme
         self.literal = literal
         self.line = line
+        # Offset of the lexeme in the source
+        self.start = start
 
     def __str__(self):
         literal_str = "null" if self.literal is None else str(self.literal)
@@ -48,7 +53,7 @@ class Scanner:
         while not self.is_at_end():
             self.start = self.current
             self.scan_token()
-        self.tokens.append(Token("EOF", "", None, self.line))
+        self.tokens.append(Token("EOF", "", None, self.line, len(self.source)))
         return self.tokens
 
     def is_at_end(self):
@@ -95,44 +100,233 @@ class Scanner:
 
     def add_token(self, type: str, literal=None):
         text = self.source[self.start:self.current]
-        self.tokens.append(Token(type, text, literal, self.line))
+        self.tokens.append(Token(type, text, literal, self.line, self.start))
+
+# ANSI control sequences used by the renderer
+CLEAR_SCREEN = "\x1b[2J\x1b[H"
+CLEAR_LINE_END = "\x1b[K"
+HIGHLIGHT = "\x1b[1m\x1b[31m"  # bold red
+RESET = "\x1b[0m"
+
+def move_to(row, col):
+    return f"\x1b[{row};{col}H"
 
 # token with highlighting!
+#
+# The screen shows a window of source lines around the current token and a
+# panel with the last `history` processed tokens. Stepping to the next token
+# only rewrites the previous and current lexemes and appends one panel line,
+# which scrolls inside its own scroll region. The window is redrawn when the
+# current token leaves it, and the panel when seeking, so a frame never
+# costs more than one screen whatever the size of the source.
 class Visualizer:
-    def __init__(self, source, tokens):
+    def __init__(self, source, tokens, delay=2.0, width=None, height=None, history=10):
         self.source = source
         self.tokens = tokens
+        self.delay = delay
+        self.lines = source.split("\n")
+        self.index = LineIndex(source)
+        self.starts = token_starts(source, tokens)
+        # Non-decreasing offsets, for seeking to the first token of a line
+        self.offsets = []
+        for start in self.starts:
+            self.offsets.append(start if start is not None else (self.offsets[-1] if self.offsets else 0))
+        size = shutil.get_terminal_size()
+        self.width = width or size.columns
+        height = height or size.lines
+        # Rows are 1-based: title, window, blank line, panel title, panel,
+        # prompt, and one spare row so the prompt's newline never scrolls
+        self.history = max(1, min(history, height - 6))
+        self.view_rows = max(1, min(len(self.lines), height - self.history - 5))
+        self.panel_top = self.view_rows + 4
+        self.panel_bottom = self.panel_top + self.history - 1
+        self.prompt_row = self.panel_bottom + 1
+        self.height = self.prompt_row + 1
+        self.top = 0
+        self.current = None
+
+    def display_tokens(self, first=0):
+        for index, frame in enumerate(self.frames(first)):
+            sys.stdout.write(frame)
+            sys.stdout.flush()
+            if 0 < index <= len(self.tokens) - first:
+                time.sleep(self.delay)
+
+    # Headless mode: writes the frames as an asciinema v2 recording, with
+    # frames delay seconds apart, without sleeping or touching the terminal
+    def record(self, path, first=0, title=None):
+        with open(path, "w") as file:
+            header = {"version": 2, "width": self.width, "height": self.height, "timestamp": int(time.time())}
+            if title:
+                header["title"] = title
+            file.write(json.dumps(header) + "\n")
+            for index, frame in enumerate(self.frames(first)):
+                file.write(json.dumps([round(index * self.delay, 6), "o", frame]) + "\n")
+
+    # Interactive mode: reads one command per line from stdin. An empty line
+    # or "n" steps forward, "p" back, "l N" jumps to the first token on line
+    # N, "t N" to the Nth token, and "q" quits.
+    def step_through(self, first=0):
+        sys.stdout.write(self.start())
+        index = first
+        while True:
+            sys.stdout.write(self.step_to(index) + move_to(self.prompt_row, 1) + "> " + CLEAR_LINE_END)
+            sys.stdout.flush()
+            line = sys.stdin.readline()
+            if not line:
+                break
+            command = line.split()
+            if not command or command[0] == "n":
+                index = min(index + 1, len(self.tokens) - 1)
+            elif command[0] == "p":
+                index = max(index - 1, 0)
+            elif command[0] == "l" and len(command) == 2 and command[1].isdigit():
+                index = self.token_at_line(int(command[1]) - 1)
+            elif command[0] == "t" and len(command) == 2 and command[1].isdigit():
+                index = min(max(int(command[1]) - 1, 0), len(self.tokens) - 1)
+            elif command[0] == "q":
+                break
+        sys.stdout.write(self.finish())
+        sys.stdout.flush()
+
+    def frames(self, first=0):
+        yield self.start()
+        for index in range(first, len(self.tokens)):
+            yield self.step_to(index)
+        yield self.finish()
+
+    def start(self):
+        self.top = 0
+        self.current = None
+        return "".join([
+            CLEAR_SCREEN,
+            f"\x1b[{self.panel_top};{self.panel_bottom}r",
+            self.draw_window(),
+            move_to(self.view_rows + 3, 1),
+            "Tokens Processed:",
+        ])
+
+    def finish(self):
+        return f"\x1b[r{move_to(self.prompt_row, 1)}{CLEAR_LINE_END}"
+
+    def step_to(self, index):
+        parts = []
+        line = self.line_of(self.offsets[index])
+        if not self.top <= line < self.top + self.view_rows:
+            # Keep the current line in the upper third of the window
+            self.top = max(0, min(line - self.view_rows // 3, len(self.lines) - self.view_rows))
+            parts.append(self.draw_window())
+        elif self.current is not None:
+            parts.append(self.draw_lexeme(self.current, ""))
+        parts.append(self.draw_lexeme(index, HIGHLIGHT))
+        if self.current is not None and index == self.current + 1:
+            parts.append(self.append_panel(index))
+        else:
+            parts.append(self.draw_panel(index))
+        self.current = index
+        return "".join(parts)
 
-    def display_tokens(self):
-        for idx, token in enumerate(self.tokens):
-            os.system("clear" if os.name == "posix" else "cls")
-
-            highlighted_code = self.highlight_token(idx)
-            print("Input Code:\n" + highlighted_code)
-            print(f"\nTokens Processed:")
-            
-            for processed_token in self.tokens[:idx + 1]:
-                print(processed_token)
-            time.sleep(2)
-
-    def highlight_token(self, current_idx):
-        result = []
-        for idx, token in enumerate(self.tokens):
-            token_text = token.lexeme
-            if idx == current_idx:
-                result.append(colored(token_text, "red", attrs=["bold"]))
-            else:
-                result.append(token_text)
-        return self.source.replace(self.tokens[current_idx].lexeme, result[current_idx], 1)
+    def line_of(self, offset):
+        return self.index.position(offset)[0] - 1
+
+    # First token starting on or after the start of a 0-based line
+    def token_at_line(self, line):
+        line = min(max(line, 0), len(self.lines) - 1)
+        return min(bisect_left(self.offsets, self.index.offset(line + 1)), len(self.tokens) - 1)
+
+    def draw_window(self):
+        if self.view_rows < len(self.lines):
+            title = f"Input Code (lines {self.top + 1}-{self.top + self.view_rows} of {len(self.lines)}):"
+        else:
+            title = "Input Code:"
+        parts = [move_to(1, 1), title[:self.width], CLEAR_LINE_END]
+        for row in range(self.view_rows):
+            line = self.top + row
+            text = self.lines[line].expandtabs()[:self.width] if line < len(self.lines) else ""
+            parts.append(f"{move_to(row + 2, 1)}{text}{CLEAR_LINE_END}")
+        return "".join(parts)
+
+    # Rewrites the part of one token's lexeme that is inside the window
+    def draw_lexeme(self, index, style):
+        start = self.starts[index]
+        lexeme = self.tokens[index].lexeme
+        if start is None or not lexeme:
+            return ""
+        line = self.line_of(start)
+        parts = []
+        for segment in lexeme.split("\n"):
+            if self.top <= line < self.top + self.view_rows:
+                prefix = self.lines[line][:start - self.index.offset(line + 1)]
+                column = len(prefix.expandtabs())
+                text = (prefix + segment).expandtabs()[column:self.width]
+                if text:
+                    parts.append(f"{move_to(line - self.top + 2, column + 1)}{style}{text}{RESET if style else ''}")
+            line += 1
+            start = self.index.offset(line + 1)
+        return "".join(parts)
+
+    def append_panel(self, index):
+        text = str(self.tokens[index])[:self.width]
+        if index < self.history:
+            return f"{move_to(self.panel_top + index, 1)}{text}{CLEAR_LINE_END}"
+        # Scroll the panel region up by one line and write at its bottom
+        return f"{move_to(self.panel_bottom, 1)}\n{text}{CLEAR_LINE_END}"
+
+    def draw_panel(self, index):
+        first = max(0, index - self.history + 1)
+        parts = []
+        for row in range(self.history):
+            text = str(self.tokens[first + row])[:self.width] if first + row <= index else ""
+            parts.append(f"{move_to(self.panel_top + row, 1)}{text}{CLEAR_LINE_END}")
+        return "".join(parts)
+
+# Source offset of each token. Tokens without a start are located by
+# searching forward from the end of the previous token.
+def token_starts(source, tokens):
+    starts = []
+    position = 0
+    for token in tokens:
+        start = getattr(token, "start", None)
+        if start is None and token.lexeme:
+            found = source.find(token.lexeme, position)
+            start = found if found >= 0 else None
+        starts.append(start)
+        if start is not None:
+            position = start + len(token.lexeme)
+    return starts
 
 # Main function
 def main():
-    if len(sys.argv) < 3:
-        print("Usage: python3 main.py <command> <filename>", file=sys.stderr)
+    args = sys.argv[1:]
+    delay = 2.0
+    asciicast = None
+    history = 10
+    line = token = None
+    step = False
+    positional = []
+    while args:
+        arg = args.pop(0)
+        if arg == "--delay" and args:
+            delay = float(args.pop(0))
+        elif arg == "--asciicast" and args:
+            asciicast = args.pop(0)
+        elif arg == "--history" and args:
+            history = int(args.pop(0))
+        elif arg == "--line" and args:
+            line = int(args.pop(0))
+        elif arg == "--token" and args:
+            token = int(args.pop(0))
+        elif arg == "--step":
+            step = True
+        else:
+            positional.append(arg)
+
+    if len(positional) < 2:
+        print("Usage: python3 main.py <command> <filename> [--delay SECONDS] [--asciicast FILE] [--history N] [--line N | --token N] [--step]", file=sys.stderr)
         exit(1)
 
-    command = sys.argv[1]
-    filename = sys.argv[2]
+    command = positional[0]
+    filename = positional[1]
 
     with open(filename) as file:
         file_contents = file.read()
@@ -141,8 +335,25 @@ def main():
     tokens = scanner.scan_tokens()
 
     if command == "tokenize":
-        visualizer = Visualizer(file_contents, tokens)
-        visualizer.display_tokens()
+        if asciicast:
+            # Headless: a fixed 80 columns, and a window of up to 40 lines
+            height = min(file_contents.count("\n") + 1, 40) + history + 5
+            visualizer = Visualizer(file_contents, tokens, delay, width=80, height=height, history=history)
+        else:
+            visualizer = Visualizer(file_contents, tokens, delay, history=history)
+
+        first = 0
+        if line is not None:
+            first = visualizer.token_at_line(line - 1)
+        elif token is not None:
+            first = min(max(token - 1, 0), len(tokens) - 1)
+
+        if asciicast:
+            visualizer.record(asciicast, first, title=filename)
+        elif step:
+            visualizer.step_through(first)
+        else:
+            visualizer.display_tokens(first)
 
 if __name__ == "__main__":
     main()
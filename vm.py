@@ -0,0 +1,650 @@
+import sys
+from array import array
+
+from main import (
+    GROUP_MARKER,
+    Binary,
+    Grouping,
+    Literal,
+    LoxRuntimeError,
+    PrattParser,
+    Unary,
+    divide,
+    is_equal,
+    stringify,
+)
+
+# Expression and statement nodes beyond the ones main.Parser builds
+class Variable:
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+class Assign:
+    __slots__ = ("name", "value")
+
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+class Logical:
+    __slots__ = ("left", "operator", "right")
+
+    def __init__(self, left, operator, right):
+        self.left = left
+        self.operator = operator
+        self.right = right
+
+class Expression:
+    __slots__ = ("expression",)
+
+    def __init__(self, expression):
+        self.expression = expression
+
+class Print:
+    __slots__ = ("expression",)
+
+    def __init__(self, expression):
+        self.expression = expression
+
+class Var:
+    __slots__ = ("name", "initializer")
+
+    def __init__(self, name, initializer):
+        self.name = name
+        self.initializer = initializer
+
+class Block:
+    __slots__ = ("statements",)
+
+    def __init__(self, statements):
+        self.statements = statements
+
+class If:
+    __slots__ = ("condition", "then_branch", "else_branch")
+
+    def __init__(self, condition, then_branch, else_branch):
+        self.condition = condition
+        self.then_branch = then_branch
+        self.else_branch = else_branch
+
+class While:
+    __slots__ = ("condition", "body")
+
+    def __init__(self, condition, body):
+        self.condition = condition
+        self.body = body
+
+class ParseError(Exception):
+    pass
+
+# Binding power of each operator in run programs, lowest first. Assignment
+# is right-associative: it binds like OR when met but is stacked one level
+# lower, so a following assignment does not reduce it.
+PROGRAM_PRECEDENCE = {
+    "EQUAL": 2, "OR": 2, "AND": 3,
+    "BANG_EQUAL": 4, "EQUAL_EQUAL": 4,
+    "GREATER": 5, "GREATER_EQUAL": 5, "LESS": 5, "LESS_EQUAL": 5,
+    "MINUS": 6, "PLUS": 6,
+    "SLASH": 7, "STAR": 7,
+}
+STACKED_ASSIGNMENT = 1
+PROGRAM_PREFIX_PRECEDENCE = 8
+LITERAL_KEYWORDS = {"FALSE": False, "TRUE": True, "NIL": None}
+
+# Statement parser for the run command. Adds declarations and statements to
+# PrattParser, and extends its expression loop with variables, assignment
+# and logical operators, so expressions nest as deep as they do for parse.
+class ProgramParser(PrattParser):
+    def parse(self):
+        statements = []
+        while not self.is_at_end():
+            try:
+                statements.append(self.nested(self.declaration()))
+            except ParseError:
+                self.synchronize()
+        return statements
+
+    # The statement rules below are generators. A rule yields the rule for
+    # each statement nested in it, is sent back what that rule returned, and
+    # returns its own statement. nested() runs them from an explicit stack,
+    # so blocks, ifs and loops nest without recursing.
+    def nested(self, rule):
+        rules = [rule]
+        result = None
+        while True:
+            try:
+                child = rules[-1].send(result)
+            except StopIteration as done:
+                rules.pop()
+                result = done.value
+                if not rules:
+                    return result
+            else:
+                rules.append(child)
+                result = None
+
+    def declaration(self):
+        if self.match("VAR"):
+            name = self.consume("IDENTIFIER", "Expect variable name.")
+            initializer = self.expression() if self.match("EQUAL") else None
+            self.consume("SEMICOLON", "Expect ';' after variable declaration.")
+            return Var(name, initializer)
+        return (yield self.statement())
+
+    def statement(self):
+        if self.match("PRINT"):
+            value = self.expression()
+            self.consume("SEMICOLON", "Expect ';' after value.")
+            return Print(value)
+        if self.match("LEFT_BRACE"):
+            return Block((yield self.block()))
+        if self.match("IF"):
+            self.consume("LEFT_PAREN", "Expect '(' after 'if'.")
+            condition = self.expression()
+            self.consume("RIGHT_PAREN", "Expect ')' after if condition.")
+            then_branch = yield self.statement()
+            else_branch = (yield self.statement()) if self.match("ELSE") else None
+            return If(condition, then_branch, else_branch)
+        if self.match("WHILE"):
+            self.consume("LEFT_PAREN", "Expect '(' after 'while'.")
+            condition = self.expression()
+            self.consume("RIGHT_PAREN", "Expect ')' after condition.")
+            return While(condition, (yield self.statement()))
+        if self.match("FOR"):
+            return (yield self.for_statement())
+        expr = self.expression()
+        self.consume("SEMICOLON", "Expect ';' after expression.")
+        return Expression(expr)
+
+    def for_statement(self):
+        # Desugared into a block holding the initializer and a while loop
+        self.consume("LEFT_PAREN", "Expect '(' after 'for'.")
+        if self.match("SEMICOLON"):
+            initializer = None
+        elif self.check("VAR"):
+            initializer = yield self.declaration()
+        else:
+            initializer = yield self.statement()
+        condition = None if self.check("SEMICOLON") else self.expression()
+        self.consume("SEMICOLON", "Expect ';' after loop condition.")
+        increment = None if self.check("RIGHT_PAREN") else self.expression()
+        self.consume("RIGHT_PAREN", "Expect ')' after for clauses.")
+
+        body = yield self.statement()
+        if increment is not None:
+            body = Block([body, Expression(increment)])
+        body = While(condition or Literal(True), body)
+        return Block([initializer, body]) if initializer is not None else body
+
+    def block(self):
+        statements = []
+        while not self.check("RIGHT_BRACE") and not self.is_at_end():
+            statements.append((yield self.declaration()))
+        self.consume("RIGHT_BRACE", "Expect '}' after block.")
+        return statements
+
+    def expression(self):
+        tokens = self.tokens
+        precedence_of = PROGRAM_PRECEDENCE.get
+        operands = []
+        operators = []
+
+        while True:
+            # Operand position, as in PrattParser, plus names and keyword literals
+            while True:
+                token = tokens[self.current]
+                kind = token.type
+                if kind == "MINUS" or kind == "BANG":
+                    operators.append((PROGRAM_PREFIX_PRECEDENCE, token))
+                elif kind == "LEFT_PAREN":
+                    operators.append(GROUP_MARKER)
+                else:
+                    break
+                self.current += 1
+
+            if kind == "NUMBER" or kind == "STRING":
+                operands.append(Literal(token.literal))
+            elif kind == "IDENTIFIER":
+                operands.append(Variable(token))
+            elif kind in LITERAL_KEYWORDS:
+                operands.append(Literal(LITERAL_KEYWORDS[kind]))
+            else:
+                raise self.error("Expect expression.")
+            self.current += 1
+
+            # Operator position; any other token closes everything but groups
+            while True:
+                token = tokens[self.current]
+                precedence = precedence_of(token.type, 1)
+                while operators and operators[-1][0] >= precedence:
+                    operator_precedence, operator = operators.pop()
+                    right = operands.pop()
+                    if operator_precedence == PROGRAM_PREFIX_PRECEDENCE:
+                        operands.append(Unary(operator, right))
+                    elif operator.type == "EQUAL":
+                        target = operands.pop()
+                        if type(target) is Variable:
+                            operands.append(Assign(target.name, right))
+                        else:
+                            self.error("Invalid assignment target.", operator)
+                            operands.append(target)
+                    elif operator.type == "OR" or operator.type == "AND":
+                        operands.append(Logical(operands.pop(), operator, right))
+                    else:
+                        operands.append(Binary(operands.pop(), operator, right))
+                if token.type in PROGRAM_PRECEDENCE:
+                    self.current += 1
+                    operators.append((STACKED_ASSIGNMENT if token.type == "EQUAL" else precedence, token))
+                    break
+                if not operators:
+                    return operands.pop()
+                operators.pop()
+                self.consume("RIGHT_PAREN", "Expect ')' after expression.")
+                operands.append(Grouping(operands.pop()))
+
+    def consume(self, token_type, message):
+        if self.check(token_type):
+            return self.advance()
+        raise self.error(message)
+
+    def error(self, message: str, token=None):
+        # Records the error; callers raise the result when they cannot go on
+        token = token or self.peek()
+        where = "end" if token.type == "EOF" else f"'{token.lexeme}'"
+        self.errors.append(f"[line {token.line}] Error at {where}: {message}")
+        return ParseError()
+
+    def synchronize(self):
+        self.advance()
+        while not self.is_at_end():
+            if self.previous().type == "SEMICOLON":
+                return
+            if self.peek().type in ("CLASS", "FUN", "VAR", "FOR", "IF", "WHILE", "PRINT", "RETURN"):
+                return
+            self.advance()
+
+# Opcodes. Operands follow their opcode in the code array.
+(
+    CONSTANT, NIL, TRUE, FALSE, POP, POPN,
+    GET_LOCAL, SET_LOCAL, GET_GLOBAL, SET_GLOBAL, DEFINE_GLOBAL,
+    EQUAL, NOT_EQUAL, GREATER, GREATER_EQUAL, LESS, LESS_EQUAL,
+    ADD, SUBTRACT, MULTIPLY, DIVIDE, NOT, NEGATE,
+    PRINT, JUMP, JUMP_IF_FALSE, JUMP_IF_TRUE, LOOP, RETURN,
+) = range(29)
+
+BINARY_OPCODES = {
+    "EQUAL_EQUAL": EQUAL, "BANG_EQUAL": NOT_EQUAL,
+    "GREATER": GREATER, "GREATER_EQUAL": GREATER_EQUAL,
+    "LESS": LESS, "LESS_EQUAL": LESS_EQUAL,
+    "PLUS": ADD, "MINUS": SUBTRACT, "STAR": MULTIPLY, "SLASH": DIVIDE,
+}
+
+# Steps Compiler.expression defers until an operand has been compiled
+AFTER_BINARY, AFTER_UNARY, AFTER_ASSIGN, AFTER_LEFT, AFTER_RIGHT = range(5)
+# and Compiler.statement until a nested statement has
+END_BLOCK, AFTER_THEN, AFTER_ELSE, AFTER_BODY = range(4)
+
+# Unset global slots hold this marker
+UNDEFINED = object()
+
+class Chunk:
+    __slots__ = ("code", "lines", "constants", "global_names")
+
+    def __init__(self):
+        self.code = array("i")
+        self.lines = array("I")
+        self.constants = []
+        self.global_names = []
+
+class CompileError(Exception):
+    def __init__(self, message: str, token):
+        super().__init__(message)
+        self.message = message
+        self.token = token
+
+# Compiles statements to a Chunk. Variables are resolved here: locals to
+# their stack slot, globals to an index into the VM's global array.
+class Compiler:
+    def __init__(self):
+        self.chunk = Chunk()
+        self.constant_indexes = {}
+        self.global_slots = {}
+        self.locals = []
+        self.scope_depth = 0
+        self.line = 0
+
+    def compile(self, statements) -> Chunk:
+        for statement in statements:
+            self.statement(statement)
+        self.emit(RETURN)
+        return self.chunk
+
+    def emit(self, *codes: int):
+        self.chunk.code.extend(codes)
+        self.chunk.lines.extend([self.line] * len(codes))
+
+    def emit_jump(self, opcode: int) -> int:
+        self.emit(opcode, 0)
+        return len(self.chunk.code) - 1
+
+    def patch_jump(self, operand: int):
+        self.chunk.code[operand] = len(self.chunk.code) - operand - 1
+
+    def emit_loop(self, loop_start: int):
+        self.emit(LOOP, len(self.chunk.code) + 2 - loop_start)
+
+    def constant(self, value) -> int:
+        key = (type(value), value)
+        index = self.constant_indexes.get(key)
+        if index is None:
+            index = self.constant_indexes[key] = len(self.chunk.constants)
+            self.chunk.constants.append(value)
+        return index
+
+    # Names are compared by their token's symbol id, not by text
+    def global_slot(self, name) -> int:
+        symbol = name.symbol
+        slot = self.global_slots.get(symbol)
+        if slot is None:
+            slot = self.global_slots[symbol] = len(self.chunk.global_names)
+            self.chunk.global_names.append(name.lexeme)
+        return slot
+
+    def resolve_local(self, name) -> int:
+        symbol = name.symbol
+        for slot in range(len(self.locals) - 1, -1, -1):
+            local_symbol, depth = self.locals[slot]
+            if local_symbol == symbol:
+                if depth is None:
+                    raise CompileError("Can't read local variable in its own initializer.", name)
+                return slot
+        return -1
+
+    # Statements. Like expressions, compiled from an explicit work stack of
+    # statements and the steps left for after their bodies.
+    def statement(self, stmt):
+        work = [stmt]
+        while work:
+            stmt = work.pop()
+            kind = type(stmt)
+            if kind is Expression:
+                self.expression(stmt.expression)
+                self.emit(POP)
+            elif kind is Print:
+                self.expression(stmt.expression)
+                self.emit(PRINT)
+            elif kind is Var:
+                self.var_declaration(stmt)
+            elif kind is Block:
+                self.scope_depth += 1
+                work.append((END_BLOCK, None))
+                work.extend(reversed(stmt.statements))
+            elif kind is If:
+                self.expression(stmt.condition)
+                then_jump = self.emit_jump(JUMP_IF_FALSE)
+                self.emit(POP)
+                work.append((AFTER_THEN, (then_jump, stmt.else_branch)))
+                work.append(stmt.then_branch)
+            elif kind is While:
+                loop_start = len(self.chunk.code)
+                self.expression(stmt.condition)
+                exit_jump = self.emit_jump(JUMP_IF_FALSE)
+                self.emit(POP)
+                work.append((AFTER_BODY, (loop_start, exit_jump)))
+                work.append(stmt.body)
+            elif kind is tuple:
+                step, argument = stmt
+                if step == END_BLOCK:
+                    self.end_scope()
+                elif step == AFTER_THEN:
+                    then_jump, else_branch = argument
+                    else_jump = self.emit_jump(JUMP)
+                    self.patch_jump(then_jump)
+                    self.emit(POP)
+                    work.append((AFTER_ELSE, else_jump))
+                    if else_branch is not None:
+                        work.append(else_branch)
+                elif step == AFTER_ELSE:
+                    self.patch_jump(argument)
+                else:
+                    loop_start, exit_jump = argument
+                    self.emit_loop(loop_start)
+                    self.patch_jump(exit_jump)
+                    self.emit(POP)
+
+    def var_declaration(self, stmt: Var):
+        name = stmt.name
+        self.line = name.line
+        if self.scope_depth == 0:
+            self.initializer(stmt.initializer)
+            self.emit(DEFINE_GLOBAL, self.global_slot(name))
+            return
+        symbol = name.symbol
+        for local_symbol, depth in reversed(self.locals):
+            if depth is not None and depth < self.scope_depth:
+                break
+            if local_symbol == symbol:
+                raise CompileError("Already a variable with this name in this scope.", name)
+        # The initializer's value stays on the stack as the local's slot
+        self.locals.append((symbol, None))
+        self.initializer(stmt.initializer)
+        self.locals[-1] = (symbol, self.scope_depth)
+
+    def initializer(self, expr):
+        if expr is None:
+            self.emit(NIL)
+        else:
+            self.expression(expr)
+
+    def end_scope(self):
+        self.scope_depth -= 1
+        count = 0
+        while self.locals and self.locals[-1][1] > self.scope_depth:
+            self.locals.pop()
+            count += 1
+        if count == 1:
+            self.emit(POP)
+        elif count:
+            self.emit(POPN, count)
+
+    # Expressions. Nodes are compiled from an explicit work stack that also
+    # holds the steps left for after their operands (tagged tuples), so
+    # nesting depth is not limited by recursion.
+    def expression(self, expr):
+        work = [expr]
+        while work:
+            expr = work.pop()
+            kind = type(expr)
+            if kind is tuple:
+                step, argument = expr
+                if step == AFTER_BINARY:
+                    self.line = argument.line
+                    self.emit(BINARY_OPCODES[argument.type])
+                elif step == AFTER_UNARY:
+                    self.line = argument.line
+                    self.emit(NOT if argument.type == "BANG" else NEGATE)
+                elif step == AFTER_ASSIGN:
+                    self.line = argument.line
+                    slot = self.resolve_local(argument)
+                    if slot >= 0:
+                        self.emit(SET_LOCAL, slot)
+                    else:
+                        self.emit(SET_GLOBAL, self.global_slot(argument))
+                elif step == AFTER_LEFT:
+                    jump = self.emit_jump(JUMP_IF_TRUE if argument.operator.type == "OR" else JUMP_IF_FALSE)
+                    self.emit(POP)
+                    work.append((AFTER_RIGHT, jump))
+                    work.append(argument.right)
+                else:
+                    self.patch_jump(argument)
+            elif kind is Literal:
+                value = expr.value
+                if value is None:
+                    self.emit(NIL)
+                elif value is True:
+                    self.emit(TRUE)
+                elif value is False:
+                    self.emit(FALSE)
+                else:
+                    self.emit(CONSTANT, self.constant(float(value) if type(value) is int else value))
+            elif kind is Grouping:
+                work.append(expr.expression)
+            elif kind is Binary:
+                work.append((AFTER_BINARY, expr.operator))
+                work.append(expr.right)
+                work.append(expr.left)
+            elif kind is Unary:
+                work.append((AFTER_UNARY, expr.operator))
+                work.append(expr.right)
+            elif kind is Variable:
+                self.line = expr.name.line
+                slot = self.resolve_local(expr.name)
+                if slot >= 0:
+                    self.emit(GET_LOCAL, slot)
+                else:
+                    self.emit(GET_GLOBAL, self.global_slot(expr.name))
+            elif kind is Assign:
+                work.append((AFTER_ASSIGN, expr.name))
+                work.append(expr.value)
+            elif kind is Logical:
+                work.append((AFTER_LEFT, expr))
+                work.append(expr.left)
+
+# Stack machine executing a Chunk. Locals live in the bottom slots of the
+# value stack; globals in a list indexed by the compiler's slot numbers.
+class VM:
+    def __init__(self, chunk: Chunk, out=None):
+        self.chunk = chunk
+        self.globals = [UNDEFINED] * len(chunk.global_names)
+        self.out = out or sys.stdout
+
+    def run(self):
+        code = self.chunk.code
+        constants = self.chunk.constants
+        globals = self.globals
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        write = self.out.write
+        ip = 0
+
+        while True:
+            op = code[ip]
+            ip += 1
+            if op == GET_LOCAL:
+                push(stack[code[ip]])
+                ip += 1
+            elif op == CONSTANT:
+                push(constants[code[ip]])
+                ip += 1
+            elif op == GET_GLOBAL:
+                value = globals[code[ip]]
+                if value is UNDEFINED:
+                    self.error(ip - 1, f"Undefined variable '{self.chunk.global_names[code[ip]]}'.")
+                push(value)
+                ip += 1
+            elif op == JUMP_IF_FALSE:
+                value = stack[-1]
+                if value is None or value is False:
+                    ip += code[ip]
+                ip += 1
+            elif op == POP:
+                pop()
+            elif op == LOOP:
+                ip -= code[ip] - 1
+            elif op == SET_LOCAL:
+                stack[code[ip]] = stack[-1]
+                ip += 1
+            elif op == SET_GLOBAL:
+                if globals[code[ip]] is UNDEFINED:
+                    self.error(ip - 1, f"Undefined variable '{self.chunk.global_names[code[ip]]}'.")
+                globals[code[ip]] = stack[-1]
+                ip += 1
+            elif op == ADD:
+                b = pop()
+                a = stack[-1]
+                if type(a) is type(b) and (type(a) is float or type(a) is str):
+                    stack[-1] = a + b
+                else:
+                    self.error(ip - 1, "Operands must be two numbers or two strings.")
+            elif GREATER <= op <= DIVIDE:
+                # Numeric comparisons and arithmetic; ADD was handled above
+                b = pop()
+                a = stack[-1]
+                if type(a) is not float or type(b) is not float:
+                    self.error(ip - 1, "Operands must be numbers.")
+                if op == LESS:
+                    stack[-1] = a < b
+                elif op == SUBTRACT:
+                    stack[-1] = a - b
+                elif op == MULTIPLY:
+                    stack[-1] = a * b
+                elif op == GREATER:
+                    stack[-1] = a > b
+                elif op == LESS_EQUAL:
+                    stack[-1] = a <= b
+                elif op == GREATER_EQUAL:
+                    stack[-1] = a >= b
+                else:
+                    stack[-1] = divide(a, b)
+            elif op == JUMP:
+                ip += code[ip] + 1
+            elif op == JUMP_IF_TRUE:
+                value = stack[-1]
+                if value is not None and value is not False:
+                    ip += code[ip]
+                ip += 1
+            elif op == EQUAL:
+                b = pop()
+                stack[-1] = is_equal(stack[-1], b)
+            elif op == NOT_EQUAL:
+                b = pop()
+                stack[-1] = not is_equal(stack[-1], b)
+            elif op == NOT:
+                value = stack[-1]
+                stack[-1] = value is None or value is False
+            elif op == NEGATE:
+                if type(stack[-1]) is not float:
+                    self.error(ip - 1, "Operand must be a number.")
+                stack[-1] = -stack[-1]
+            elif op == PRINT:
+                write(stringify(pop()) + "\n")
+            elif op == NIL:
+                push(None)
+            elif op == TRUE:
+                push(True)
+            elif op == FALSE:
+                push(False)
+            elif op == DEFINE_GLOBAL:
+                globals[code[ip]] = pop()
+                ip += 1
+            elif op == POPN:
+                del stack[len(stack) - code[ip]:]
+                ip += 1
+            elif op == RETURN:
+                return
+
+    def error(self, ip: int, message: str):
+        raise LoxRuntimeError(message, self.chunk.lines[ip])
+
+# Compiles and runs a token stream; returns the process exit code
+def run(tokens) -> int:
+    parser = ProgramParser(tokens)
+    statements = parser.parse()
+    if parser.errors:
+        for error in parser.errors:
+            print(error, file=sys.stderr)
+        return 65
+    try:
+        chunk = Compiler().compile(statements)
+    except CompileError as error:
+        print(f"[line {error.token.line}] Error at '{error.token.lexeme}': {error.message}", file=sys.stderr)
+        return 65
+    try:
+        VM(chunk).run()
+    except LoxRuntimeError as error:
+        print(f"{error.message}\n[line {error.line}]", file=sys.stderr)
+        return 70
+    return 0